@@ -3,11 +3,8 @@ import logging
 import os
 import pathlib
 import sys
-import warnings
 from io import TextIOWrapper
 
-from datamolecule import make_structure, DataMolecule
-
 
 def command_line():
     parser = argparse.ArgumentParser(
@@ -27,10 +24,98 @@ def command_line():
                        help="silence output")
 
     parser.add_argument('infile',
-                        # nargs='?',
+                        nargs='?',
                         type=argparse.FileType('r'),
                         # default=sys.stdin,
-                        help="Input file name.")
+                        help="Input file name. Not needed with --watch.")
+
+    parser.add_argument('-w',
+                        '--watch',
+                        type=pathlib.Path,
+                        help="Keep running and process every new or changed report dropped in this directory.")
+
+    parser.add_argument('--watch-pattern',
+                        type=str,
+                        default='*.txt',
+                        help="File name pattern of reports picked up by --watch.")
+
+    parser.add_argument('--poll',
+                        type=float,
+                        default=5.0,
+                        help="Seconds between scans of the watched directory.")
+
+    parser.add_argument('--debounce',
+                        type=float,
+                        default=30.0,
+                        help="Seconds a watched report must stay unchanged before it is processed.")
+
+    parser.add_argument('--status',
+                        type=pathlib.Path,
+                        help="Status file written by --watch. Defaults to .gcmspydft-status.json in the watched "
+                             "directory.")
+
+    parser.add_argument('--harvest',
+                        type=pathlib.Path,
+                        nargs='?',
+                        const=True,
+                        help="Import the final geometries of finished Gaussian jobs under this directory, or the "
+                             "output directory when none is given, into the geometry library and exit.")
+
+    parser.add_argument('--queue',
+                        type=pathlib.Path,
+                        help="Shared work queue database. With an input file its molecules are added to the queue, "
+                             "with --worker they are processed.")
+
+    parser.add_argument('--worker',
+                        action='store_true',
+                        help="Process tasks from --queue until none are left.")
+
+    parser.add_argument('--lease',
+                        type=float,
+                        default=600.0,
+                        help="Seconds a worker holds claimed tasks before another worker may take them over.")
+
+    parser.add_argument('--batch',
+                        type=int,
+                        default=10,
+                        help="Number of tasks a worker claims at once.")
+
+    parser.add_argument('--cache-size',
+                        type=int,
+                        default=1024,
+                        help="Largest number of structures kept in memory between reports.")
+
+    parser.add_argument('-R',
+                        '--replicates',
+                        type=argparse.FileType('r'),
+                        nargs='+',
+                        help="Replicate runs of the input file. Peaks are aligned by retention time and "
+                             "merged into one set of input files.")
+
+    parser.add_argument('--rt-tolerance',
+                        type=float,
+                        default=0.05,
+                        help="Retention time tolerance, in minutes, used to align replicate peaks.")
+
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        help="Number of processes used to parse the input file.")
+
+    parser.add_argument('-p',
+                        '--peaks',
+                        type=int,
+                        nargs='+',
+                        help="Only parse the peaks at these positions in the input file.")
+
+    parser.add_argument('--log-level',
+                        choices=["DEBUG", "INFO", "WARNING"],
+                        default="INFO",
+                        help="Lowest level written to the log file, DEBUG adds every parsing step.")
+
+    parser.add_argument('--log-json',
+                        type=pathlib.Path,
+                        help="Also write log events as JSON lines to this file.")
 
     parser.add_argument('-V',
                         '--version',
@@ -87,44 +172,31 @@ def command_line():
                         help="Modify redundant internal coordinate definitions to be include at "
                              "the end of each input file.")
 
-    return parser.parse_args()
+    arguments = parser.parse_args()
+    if arguments.worker and arguments.queue is None:
+        parser.error("--worker requires --queue")
+    if arguments.infile is None and arguments.watch is None and arguments.harvest is None and not arguments.worker:
+        parser.error("an input file is required unless --watch, --harvest or --worker is used")
+    if arguments.watch is not None and (arguments.replicates or arguments.peaks):
+        parser.error("--replicates and --peaks refer to a single input file and can not be used with --watch")
+    return arguments
 
 
 def log_settings(arguments):
+    from logqueue import start_logging
+    # Logging setup, handlers run on a background listener thread
+    listener = start_logging(verbosity=arguments.verbosity,
+                             quiet=arguments.quiet,
+                             file_level=getattr(logging, arguments.log_level),
+                             json_file=arguments.log_json)
     logger_setting = logging.getLogger('GCMSpyDFT')
-    # Logging setup
-    logger_setup = logging.getLogger('GCMSpyDFT')
-    logger_setup.setLevel(logging.DEBUG)
-
-    # create file handler which logs even debug messages
-    fh = logging.FileHandler('GCMSpyDFT.log', mode='w')
-    fh.setLevel(level=logging.DEBUG)
-    # create formatter and add it to the handlers
-    fh_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    fh.setFormatter(fh_formatter)
-    # add the handlers to the logger
-    logger_setup.addHandler(fh)
-
-    # create console handler
-    ch = logging.StreamHandler()
-    # create formatter and add it to the handlers
-    ch_formatter = logging.Formatter('%(levelname)s: %(message)s')
-    ch.setFormatter(ch_formatter)
     if arguments.verbosity:
-        # create console handler with a higher log level
-        ch.setLevel(logging.INFO)
-        logger_setting.addHandler(ch)
         logger_setting.debug("Cavitation")
     elif arguments.quiet:
-        # create console handler with no logging
-        ch.setLevel(logging.CRITICAL + 1)
-        logger_setting.addHandler(ch)
         logger_setting.debug("Quite running")
     else:
-        # create console handler with a default log level
-        ch.setLevel(logging.WARNING)
-        logger_setting.addHandler(ch)
         logger_setting.debug("Plain bagel")
+    return listener
 
 
 def configuration(arguments):
@@ -143,26 +215,26 @@ def configuration(arguments):
 
 def settings(arguments):
     from config import cfg
-    if args.output:
-        cfg.output = args.output
-    elif args.cores:
-        cfg.cores = args.cores
-    elif args.memory:
-        cfg.memory = args.memory
-    elif args.checkpoint:
-        cfg.memory = args.checkpoint
-    elif args.theory:
-        cfg.theory = args.theory
-    elif args.basis:
-        cfg.basis = args.basis
-    elif args.type:
-        cfg.calc_type = args.type
-    elif args.charge:
-        cfg.charge = args.charge
-    elif args.spin:
-        cfg.spin = args.spin
-    elif args.modred:
-        cfg.modred = args.modred
+    if arguments.output:
+        cfg.output = arguments.output
+    if arguments.cores:
+        cfg.cores = arguments.cores
+    if arguments.memory:
+        cfg.memory = arguments.memory
+    if arguments.checkpoint:
+        cfg.checkpoint = arguments.checkpoint
+    if arguments.theory:
+        cfg.theory = arguments.theory
+    if arguments.basis:
+        cfg.basis = arguments.basis
+    if arguments.type:
+        cfg.calc_type = arguments.type
+    if arguments.charge is not None:
+        cfg.charge = arguments.charge
+    if arguments.spin is not None:
+        cfg.spin = arguments.spin
+    if arguments.modred:
+        cfg.modred = arguments.modred
 
 
 def read_input_file(file: TextIOWrapper) -> list[list[str]]:
@@ -172,17 +244,17 @@ def read_input_file(file: TextIOWrapper) -> list[list[str]]:
     lines = gi.read_to_list(file)
 
     if header_line := gi.content_finder(lines) != -1:
-        file_reader_logger.debug(f'Found header for file {file} at line {header_line}.')
+        file_reader_logger.debug('Found header for file %s at line %s.', file, header_line)
         trimmed_lines = gi.trim_header(lines, header_line)
 
     else:
-        file_reader_logger.warning(f'Assuming there is no header in file {file}')
+        file_reader_logger.warning('Assuming there is no header in file %s', file)
         trimmed_lines = gi.trim_header(lines, 0)
 
     return gi.peak_agg(trimmed_lines)
 
 
-def parse_peaks(peak_lines: list[list[str]]) -> list[object]:
+def parse_peaks(peak_lines: list[list[str]], layout=None) -> list[object]:
     from peaks import Peak
 
     list_of_peaks: list[object] = []
@@ -190,7 +262,7 @@ def parse_peaks(peak_lines: list[list[str]]) -> list[object]:
         current_peak = Peak(lines)
         current_peak.peak_header()
         current_peak.left_align()
-        current_peak.add_separator()
+        current_peak.add_separator(layout=layout, use_config=layout is None)
         current_peak.combine_lines()
         current_peak.parse_lines()
 
@@ -199,95 +271,187 @@ def parse_peaks(peak_lines: list[list[str]]) -> list[object]:
     return list_of_peaks
 
 
-def create_molecules(names: list[str], structures: list[str]) -> list[DataMolecule]:
-    # TODO: added charge and spin maybe?
-    from datamolecule import DataMolecule
+def parse_peak_range(path: str, offsets: list[int], layout) -> list[object]:
+    """
+    Parses the peaks of an indexed file that start at offsets, the last offset being the end of the last peak.
+    Used as the work unit of parse_peaks_parallel, so it only relies on its arguments and never on the global
+    configuration layout.
+    """
+    import interpreter as gi
+    return parse_peaks(gi.read_peak_blocks(path, offsets), layout)
+
+
+def parse_peaks_parallel(path: str, jobs: int = 1, selection: list[int] = None) -> list[object]:
+    """
+    Indexes the peak offsets of a file and parses the peaks in chunks over a pool of processes.
+
+    The column layout is read from the configuration or guessed from the first peak once, then handed to every
+    chunk so no process changes the shared configuration.
+
+    :param path: Path of the GC-MS report.
+    :param jobs: Number of processes to parse with.
+    :param selection: Peak positions (starting at 1) to parse instead of the whole file.
+    :return: List of parsed peaks in file order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from config import cfg
+    from logqueue import init_worker_logging, pool_logging
+    from peaks import Layout, Peak
+    import interpreter as gi
 
-    molecule_list: list[DataMolecule] = []
+    parser_logger = logging.getLogger('GCMSpyDFT')
 
-    for name, structure in zip(names, structures):
-        current_mol = DataMolecule(name, structure)
-        current_mol.mol.addh()
-        current_mol.mol.make2D()
-        current_mol.mol.make3D()
-        current_mol.mol.OBMol.Center()
+    offsets = gi.index_peaks(path)
+    peak_count = len(offsets) - 1
+    parser_logger.info('Indexed %d peaks in %s', peak_count, path)
+    if not peak_count:
+        return []
 
-        molecule_list.append(current_mol)
+    if cfg.ref_num_start and cfg.mol_id_stop:
+        layout = Layout(cfg.ref_num_start, cfg.mol_id_stop)
+    else:
+        first_peak = Peak(gi.read_peak_blocks(path, offsets, 0, 1)[0])
+        first_peak.peak_header()
+        first_peak.left_align()
+        layout = first_peak.add_separator(use_config=False)
+    parser_logger.debug('Using column layout %s', layout)
+
+    if selection:
+        if missing := [n for n in selection if not 0 < n <= peak_count]:
+            parser_logger.warning('Skipping peaks %s, %s only has peaks 1 to %d',
+                                  ', '.join(map(str, missing)), path, peak_count)
+        ranges = [(n - 1, n) for n in selection if 0 < n <= peak_count]
+    else:
+        chunk = max(1, -(-peak_count // (jobs * 4)))
+        ranges = [(start, min(start + chunk, peak_count)) for start in range(0, peak_count, chunk)]
+
+    # each chunk only gets its own offsets, plus the one that ends its last peak
+    if jobs <= 1 or len(ranges) == 1:
+        chunks = [parse_peak_range(path, offsets[start:stop + 1], layout) for start, stop in ranges]
+    else:
+        with pool_logging() as initargs, ProcessPoolExecutor(max_workers=jobs, initializer=init_worker_logging,
+                                                             initargs=initargs) as pool:
+            futures = [pool.submit(parse_peak_range, path, offsets[start:stop + 1], layout)
+                       for start, stop in ranges]
+            chunks = [future.result() for future in futures]
+
+    return [peak for peaks in chunks for peak in peaks]
+
+
+def read_peak_list(infile: TextIOWrapper) -> list[object]:
+    """
+    Parses the peaks of the input file, in parallel with --jobs or --peaks, and merges in any --replicates.
+    """
+    if args.jobs or args.peaks:
+        infile.close()
+        peak_list: list[object] = parse_peaks_parallel(infile.name, args.jobs or 1, args.peaks)
+    else:
+        peak_blocks: list[list[str]] = read_input_file(infile)  # collection of lines organized by peak
 
-    return molecule_list
+        peak_list: list[object] = parse_peaks(peak_blocks)  # collection of peak objects
 
+    if args.replicates:
+        from replicates import merge_replicates
+        replicate_runs = [peak_list] + [parse_peaks(read_input_file(file)) for file in args.replicates]
+        peak_list = merge_replicates(replicate_runs, args.rt_tolerance)
 
-def run() -> list[str]:
+    return peak_list
+
+
+def run_settings():
+    """  Settings for this run, the configuration with the command line overrides.  """
+    from api import Settings
     from config import cfg
-    warnings.simplefilter('error')
+    return Settings.from_config(cfg,
+                                charge=args.charge,
+                                spin=args.spin,
+                                replicates=len(args.replicates) + 1 if args.replicates else 1)
 
-    peak_blocks: list[list[str]] = read_input_file(args.infile)  # collection of lines organized by peak
 
-    peak_list: list[object] = parse_peaks(peak_blocks)  # collection of peak objects
+def run(infile: TextIOWrapper = None) -> list[str]:
+    from api import generate
+    from config import cfg
+
+    if infile is None:
+        infile = args.infile
+
+    peak_list = read_peak_list(infile)
+    settings_used = run_settings()
     failed_names: list[str] = []
 
-    for peak in peak_list:
-        mol_names: list = getattr(peak, 'ID')
-
-        mol_structures: list[str] = []
-        success_names: list[str] = []
-        data_molecule: list = []  # FIXME: rename
-
-        for i, mol_name in enumerate(mol_names):
-            try:
-                structure = make_structure(mol_name)
-                mol_structures.append(structure)
-                success_names.append(mol_name)
-                logger.info(f'{cfg.OKCYAN} Success! {mol_name} is now a structure! {cfg.ENDC}')
-                # print(structure)
-                data_molecule.append((mol_name, structure, i))
-            except Warning as w:
-                failed_names.append(mol_name)
-                logger.warning(f'{cfg.FAIL} FAIL! {cfg.UNDERLINE}{mol_name}{cfg.SUNDERLINE} threw an error!\n'
-                               f'{cfg.WARNING} {str(w).strip()} {cfg.ENDC}')
-
-        # mol_structures = make_structure(mol_names)
-        peak_molecules: list[DataMolecule] = create_molecules(success_names, mol_structures)
-        # peak_molecules: list[DataMolecule] = create_molecules(*data_molecule)
-        for i, peak_molecule in enumerate(peak_molecules):
-            folder_path = (f'{cfg.output}/'
-                           f'{getattr(peak, "peak_num")}'
-                           f'-{getattr(peak, "retention_time")}'
-                           f'-{getattr(peak, "percent_area")}/'
-                           f'{getattr(peak, "reference_nums")[i]}'
-                           f'-{getattr(peak, "cas_nums")[i]}'
-                           f'-{getattr(peak, "qualities")[i]}/')
-
-            if not os.path.isdir(folder_path):
-                os.makedirs(folder_path)
-
-            # output/PK#-RT-area%/ref-cas-qual/name.gau
-            file_path = (f'{cfg.output}/'
-                         f'{getattr(peak, "peak_num")}'
-                         f'-{getattr(peak, "retention_time")}'
-                         f'-{getattr(peak, "percent_area")}/'
-                         f'{getattr(peak, "reference_nums")[i]}'
-                         f'-{getattr(peak, "cas_nums")[i]}'
-                         f'-{getattr(peak, "qualities")[i]}/'
-                         f'{getattr(peak_molecule, "name_no_space")}'
-                         f'.inp')
-
-            # %cores=1 \n %mem=50 \n %check=name_[calc_type]
-            header = (f'%NProcShared={cfg.cores}\n'
-                      f'%mem={cfg.memory}\n'
-                      f'%chk={getattr(peak_molecule, "name")}_{",".join(cfg.calc_type).lower()}.chk\n')
-
-            # #p theory/basis calc_type
-            keywords = f'\n#p {cfg.theory}/{cfg.basis} ({",".join(cfg.calc_type)})'
-
-            peak_molecule.mol.title = peak_molecule.name + ' ' + '/'.join(cfg.calc_type).strip() + ' GCMSpyDFT'
-
-            peak_molecule.mol.write(format='gau', filename=file_path, opt={'k': header + keywords}, overwrite=True)
-
-    warnings.resetwarnings()
+    for result in generate(settings=settings_used, peaks=peak_list):
+        if result.error is not None:
+            failed_names.append(result.name)
+            logger.warning('%s FAIL! %s%s%s threw an error!\n%s %s %s',
+                           cfg.FAIL, cfg.UNDERLINE, result.name, cfg.SUNDERLINE, cfg.WARNING, result.error, cfg.ENDC,
+                           extra={'event': 'failed', 'molecule': result.name, 'peak': result.peak_num})
+            continue
+
+        if result.synonym is not None:
+            logger.info('%s Success! %s is now a structure using synonym %s! %s',
+                        cfg.OKCYAN, result.name, result.synonym, cfg.ENDC,
+                        extra={'event': 'resolved', 'molecule': result.name, 'synonym': result.synonym,
+                               'peak': result.peak_num})
+        else:
+            logger.info('%s Success! %s is now a structure! %s', cfg.OKCYAN, result.name, cfg.ENDC,
+                        extra={'event': 'resolved', 'molecule': result.name, 'peak': result.peak_num})
+
+        # output/PK#-RT-area%/ref-cas-qual/name.gau
+        file_path = settings_used.output / result.path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(result.input_text)
+
     return failed_names
 
 
+def enqueue(infile: TextIOWrapper) -> int:
+    """
+    Adds every molecule of the input file to the shared work queue for --worker processes to pick up.
+    """
+    from api import peak_hits
+    from workqueue import WorkQueue
+
+    hits = [hit for peak in read_peak_list(infile) for hit in peak_hits(peak)]
+    with WorkQueue(str(args.queue)) as work_queue:
+        return work_queue.enqueue(infile.name, hits, run_settings())
+
+
+def watch(arguments) -> None:
+    """
+    Runs as a service, processing every report dropped in the watched directory with the configuration, OPSIN
+    results and 3D geometries kept in memory between reports. Each report gets its own folder in the output
+    directory.
+    """
+    from config import cfg
+    from datamolecule import error_cache, geometry_cache, structure_cache
+    from watcher import Watcher
+
+    structure_cache.maxsize = arguments.cache_size
+    error_cache.maxsize = arguments.cache_size
+    geometry_cache.maxsize = arguments.cache_size
+    output_root = cfg.output
+    configured_layout = cfg.ref_num_start, cfg.mol_id_stop
+
+    def process_report(path: str) -> None:
+        # parsing stores the layout guessed from the first peak in cfg, so every report starts from the config file
+        cfg.ref_num_start, cfg.mol_id_stop = configured_layout
+        cfg.output = output_root / pathlib.Path(path).stem
+        logger.info('Processing report %s into %s', path, cfg.output)
+        with open(path) as report:
+            if failed_molecules := run(report):
+                logger.error('List of molecules that failed to form structures. %s', failed_molecules)
+        logger.info('Finished report %s, %d structures and %d geometries cached', path,
+                    len(structure_cache), len(geometry_cache))
+
+    Watcher(str(arguments.watch), process_report,
+            interval=arguments.poll,
+            debounce=arguments.debounce,
+            pattern=arguments.watch_pattern,
+            status_path=str(arguments.status) if arguments.status else None).run()
+    cfg.output = output_root
+    cfg.ref_num_start, cfg.mol_id_stop = configured_layout
+
+
 if __name__ == '__main__':
     # run things
     args = command_line()
@@ -297,7 +461,24 @@ if __name__ == '__main__':
     configuration(args)
     logger.info("Starting settings")
     settings(args)
-    logger.info("Starting run")
-    if failed := run():
-        logger.error(f'List of molecules that failed to form structures. {failed}')
+    if args.harvest:
+        from config import cfg
+        from harvest import GeometryLibrary, harvest
+        logger.info("Starting harvest")
+        with GeometryLibrary(str(cfg.geometry_library)) as geometry_library:
+            harvest(str(cfg.output if args.harvest is True else args.harvest), geometry_library)
+    elif args.queue and args.worker:
+        from workqueue import work
+        logger.info("Starting worker")
+        work(str(args.queue), lease=args.lease, batch=args.batch, poll=args.poll)
+    elif args.queue:
+        logger.info("Adding %s to the work queue", args.infile.name)
+        enqueue(args.infile)
+    elif args.watch:
+        logger.info("Starting watcher")
+        watch(args)
+    else:
+        logger.info("Starting run")
+        if failed := run():
+            logger.error('List of molecules that failed to form structures. %s', failed)
 
@@ -0,0 +1,437 @@
+"""
+In-process interface that turns a report into input files without the command line or global configuration, e.g.
+
+    for result in generate('report.txt', Settings.from_config(theory='M062X')):
+        print(result.path, result.error or result.input_text)
+"""
+import dataclasses
+import logging
+import os
+import pathlib
+import threading
+from typing import Iterable, Iterator, TextIO
+
+from geometry import Geometry
+
+api_logger = logging.getLogger('GCMSpyDFT.api')
+
+# openbabel keeps global state in its builders and force fields, so only one thread uses it at a time
+openbabel_lock = threading.Lock()
+
+
+@dataclasses.dataclass(frozen=True)
+class Settings:
+    """
+    Everything needed to turn a report into input files. Immutable, so one instance can be shared between threads.
+    """
+    # Environment
+    output: pathlib.Path = pathlib.Path('./output/')
+    geometry_library: pathlib.Path | None = None
+
+    # OPSIN settings
+    opsin_format: str = 'SMILES'
+    acid: bool = True
+    radicals: bool = True
+    bad_stereo: bool = False
+    wildcard_radicals: bool = False
+
+    # Gaussian settings
+    cores: int = 28
+    memory: int = 50
+    checkpoint: bool = True
+    theory: str = 'B3LYP'
+    basis: str = '6-31G'
+    calc_type: tuple[str, ...] = ('Opt',)
+    charge: int | None = None  # overrides predicted charge when set
+    spin: int | None = None    # overrides predicted spin when set
+    modred: tuple[str, ...] = ()
+
+    # Report layout, guessed from the first peak when not set
+    layout: tuple[int, int] | None = None
+    replicates: int = 1  # number of replicate runs merged into the peaks
+
+    @classmethod
+    def from_config(cls, config=None, **overrides) -> 'Settings':
+        """
+        Copies the values of a Config instance, by default the global one, into a new Settings.
+
+        :param config: Config to copy from.
+        :param overrides: Settings to use instead of the configured values.
+        :return: New settings.
+        """
+        if config is None:
+            from config import cfg as config
+        values = dict(
+            output=pathlib.Path(config.output),
+            geometry_library=getattr(config, 'geometry_library', None),
+            opsin_format=config.opsin_format,
+            acid=config.acid,
+            radicals=config.radicals,
+            bad_stereo=config.bad_stereo,
+            wildcard_radicals=config.wildcard_radicals,
+            cores=config.cores,
+            memory=config.memory,
+            checkpoint=config.checkpoint,
+            theory=config.theory,
+            basis=config.basis,
+            calc_type=tuple(config.calc_type),
+            modred=tuple(getattr(config, 'modred', ()) or ()),
+        )
+        if config.ref_num_start and config.mol_id_stop:
+            values['layout'] = (config.ref_num_start, config.mol_id_stop)
+        values.update(overrides)
+        return cls(**values)
+
+    def replace(self, **changes) -> 'Settings':
+        """  Returns a copy with some settings changed.  """
+        return dataclasses.replace(self, **changes)
+
+    def as_dict(self) -> dict:
+        """  Returns the settings as a JSON serializable dictionary.  """
+        values = dataclasses.asdict(self)
+        values['output'] = str(self.output)
+        values['geometry_library'] = None if self.geometry_library is None else str(self.geometry_library)
+        return values
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'Settings':
+        """  Inverse of as_dict.  """
+        values = dict(values)
+        values['output'] = pathlib.Path(values['output'])
+        if values.get('geometry_library') is not None:
+            values['geometry_library'] = pathlib.Path(values['geometry_library'])
+        for key in ('calc_type', 'modred', 'layout'):
+            if values.get(key) is not None:
+                values[key] = tuple(values[key])
+        return cls(**values)
+
+
+@dataclasses.dataclass
+class HitResult:
+    """
+    Outcome for one proposed molecule of one peak.
+    """
+    peak_num: int
+    retention_time: float
+    percent_area: float
+    index: int                    # position of the molecule in the peak
+    name: str
+    reference_num: int
+    cas_num: int
+    quality: int
+    replicates: int = 1           # number of replicate runs the molecule was found in
+    synonym: str | None = None    # synonym used when the name itself failed
+    structure: str | None = None  # structure in structure_format
+    structure_format: str | None = None
+    inchikey: str | None = None   # InChIKey of the structure
+    geometry: Geometry | None = None  # 3D geometry
+    input_text: str | None = None  # rendered Gaussian input file
+    error: str | None = None
+
+    @property
+    def path(self) -> pathlib.Path:
+        """  Path of the input file relative to the output directory, PK#-RT-area%/ref-cas-qual/name.inp  """
+        return pathlib.Path(f'{self.peak_num}-{self.retention_time}-{self.percent_area}',
+                            f'{self.reference_num}-{self.cas_num}-{self.quality}',
+                            f'{self.name.strip().replace(" ", "_")}.inp')
+
+
+def resolve_names(names: list[str], settings: Settings, out_format: str = None,
+                  errors: dict[str, str] = None) -> list[str]:
+    """
+    Converts names to structures with a single OPSIN call, reusing cached results. Nothing is cached when OPSIN
+    itself fails, so the names are tried again next time.
+
+    :param names: Names to convert.
+    :param settings: OPSIN settings to use.
+    :param out_format: Format of the structures, defaults to settings.opsin_format. Formats that do not give one
+                       line per name, CML and StdInChIKey, are replaced by SMILES, see datamolecule.batch_format.
+    :param errors: Filled with the reason OPSIN gave for each name it could not convert, when it gave one.
+    :return: Structure for each name, empty where OPSIN could not convert it.
+    :raises datamolecule.OpsinError: If OPSIN could not be run, which says nothing about the names.
+    """
+    from datamolecule import batch_format, error_cache, run_opsin, structure_cache
+
+    out_format = batch_format(out_format or settings.opsin_format)
+    flags = (settings.acid, settings.radicals, settings.bad_stereo, settings.wildcard_radicals)
+    results = {name: structure_cache.get((name, out_format, flags)) for name in names}
+    missing = list(dict.fromkeys(name for name, result in results.items() if result is None))
+
+    if missing:
+        reasons: dict[str, str] = {}
+        structures = run_opsin(missing, out_format, *flags, errors=reasons)
+        for name, structure in zip(missing, structures):
+            structure_cache.put((name, out_format, flags), structure)
+            if name in reasons:
+                error_cache.put((name, out_format, flags), reasons[name])
+            results[name] = structure
+
+    if errors is not None:
+        for name in names:
+            if not results[name] and (reason := error_cache.get((name, out_format, flags))):
+                errors[name] = reason
+
+    return [results[name] for name in names]
+
+
+def build_geometry(name: str, structure: str, structure_format: str, library=None) -> tuple[Geometry, str]:
+    """
+    Turns a structure into a centered 3D geometry. A harvested geometry from the library is used when there is one,
+    then an earlier embedding of the same structure, otherwise a new 3D guess is made. Openbabel is only used here.
+
+    :param name: Name of the molecule.
+    :param structure: Structure of the molecule.
+    :param structure_format: OPSIN format of the structure.
+    :param library: Optional GeometryLibrary of optimized geometries.
+    :return: Copy of the geometry of the molecule and the InChIKey of the structure.
+    """
+    from datamolecule import DataMolecule, geometry_cache
+
+    key = (structure_format, structure)
+    if library is None and (cached := geometry_cache.get(key)) is not None:
+        return cached[0].renamed(name), cached[1]
+
+    with openbabel_lock:
+        molecule = DataMolecule(name, structure=structure, structure_format=structure_format)
+        # keyed on the structure OPSIN made, the same key recorded in the input file for harvest to find
+        inchikey = molecule.mol.write('inchikey').strip()
+        # previously optimized geometries are the best starting point
+        if library is not None and inchikey and (xyz := library.get(inchikey)):
+            api_logger.info('Using harvested geometry for %s', name)
+            return Geometry.from_xyz(xyz, molecule.mol.charge, molecule.mol.spin, name), inchikey
+        if (cached := geometry_cache.get(key)) is not None:
+            return cached[0].renamed(name), cached[1]
+        molecule.mol.addh()
+        molecule.mol.make2D()
+        molecule.mol.make3D()
+        molecule.mol.OBMol.Center()
+        geometry = Geometry.from_obmol(molecule.mol.OBMol, name)
+    geometry_cache.put(key, (geometry, inchikey))
+    # callers get their own copy, so changing it can not change the cached embedding
+    return geometry.renamed(name), inchikey
+
+
+def modredundant(calc_type: list[str]) -> list[str]:
+    """
+    Adds the ModRedundant option Gaussian needs to read the modred lines after the geometry, to the Opt keyword
+    when there is one and as Geom=ModRedundant otherwise.
+    """
+    route = []
+    for keyword in calc_type:
+        name, _, options = keyword.partition('=')
+        if name.lower() == 'opt' and 'modredundant' not in options.lower():
+            options = options.strip('()')
+            keyword = f'{name}=({options},ModRedundant)' if options else f'{name}=ModRedundant'
+        route.append(keyword)
+    if not any(keyword.partition('=')[0].lower() == 'opt' for keyword in route):
+        route.append('Geom=ModRedundant')
+    return route
+
+
+def render_input(geometry: Geometry, settings: Settings, replicates: int = 1, inchikey: str = None) -> str:
+    """
+    Renders the Gaussian input file of a molecule.
+
+    :param geometry: 3D geometry of the molecule.
+    :param settings: Gaussian settings to use.
+    :param replicates: Number of replicate runs the molecule was found in.
+    :param inchikey: InChIKey of the structure, written to the title so harvest can file the result under it.
+    :return: Text of the input file.
+    """
+    calc_type = list(settings.calc_type)
+
+    # %cores=1 \n %mem=50 \n %check=name_[calc_type]
+    header = (f'%NProcShared={settings.cores}\n'
+              f'%mem={settings.memory}\n'
+              f'%chk={geometry.name}_{",".join(calc_type).lower()}.chk\n')
+
+    # #p theory/basis calc_type
+    route = modredundant(calc_type) if settings.modred else calc_type
+    keywords = f'\n#p {settings.theory}/{settings.basis} ({",".join(route)})'
+
+    title = geometry.name + ' ' + '/'.join(calc_type).strip() + ' GCMSpyDFT'
+    if settings.replicates > 1:
+        title += f' replicates {replicates}/{settings.replicates}'
+    if inchikey:
+        title += f'\nInChIKey={inchikey}'
+
+    text = geometry.to_gaussian(header + keywords, title, settings.charge, settings.spin)
+
+    if settings.modred:
+        text = text.rstrip('\n') + '\n\n' + '\n'.join(settings.modred) + '\n\n'
+    return text
+
+
+def read_peaks(source: str | os.PathLike | TextIO, settings: Settings) -> Iterator[object]:
+    """
+    Parses the peaks of a report one at a time using the layout in settings, or the layout guessed from the first
+    peak, without reading or changing the global configuration.
+
+    :param source: Path of a report or a text stream.
+    :param settings: Settings with an optional layout.
+    :return: Iterator of parsed peaks.
+    """
+    import interpreter as gi
+    from peaks import Layout, Peak
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source) as report:
+            lines = report.read().splitlines()
+    else:
+        lines = source.read().splitlines()
+
+    header_line = gi.content_finder(lines)
+    lines = lines[header_line + 1:] if header_line != -1 else lines
+
+    layout = Layout(*settings.layout) if settings.layout else None
+    while lines:
+        block = gi.peak_blocker(lines)
+        if not block:
+            continue
+        peak = Peak(block)
+        peak.peak_header()
+        peak.left_align()
+        layout = peak.add_separator(layout=layout, use_config=False)
+        peak.combine_lines()
+        peak.parse_lines()
+        yield peak
+
+
+def peak_hits(peak) -> list[tuple[HitResult, list[str]]]:
+    """
+    Makes an unresolved HitResult for every proposed molecule of a parsed peak.
+
+    :param peak: Parsed peak.
+    :return: List of results paired with the synonyms of each molecule.
+    """
+    return [(HitResult(peak_num=peak.peak_num,
+                       retention_time=peak.retention_time,
+                       percent_area=peak.percent_area,
+                       index=i,
+                       name=name,
+                       reference_num=peak.reference_nums[i],
+                       cas_num=peak.cas_nums[i],
+                       quality=peak.qualities[i],
+                       replicates=peak.hit_replicates[i]),
+             peak.synonyms[i])
+            for i, name in enumerate(peak.ID)]
+
+
+def finish_hit(result: HitResult, settings: Settings, library=None) -> HitResult:
+    """
+    Builds the geometry and renders the input file of a resolved HitResult, recording any error on the result.
+
+    :param result: Result with a structure.
+    :param settings: Settings to render with.
+    :param library: Optional GeometryLibrary of optimized geometries.
+    :return: The same result, finished.
+    """
+    try:
+        result.geometry, result.inchikey = build_geometry(result.name, result.structure, result.structure_format,
+                                                         library)
+        result.input_text = render_input(result.geometry, settings, result.replicates, result.inchikey)
+    except Exception as e:
+        api_logger.warning('Could not build %s: %r', result.name, e)
+        result.error = f'Could not build molecule: {e!r}'
+    return result
+
+
+def resolve_hits(hits: list[tuple[HitResult, list[str]]], settings: Settings, library=None,
+                 failed: list[tuple[HitResult, list[str]]] = None) -> Iterator[HitResult]:
+    """
+    Converts the names of a batch of hits in one OPSIN call and yields each finished result.
+
+    Hits whose name failed are appended to failed when it is given, so their synonyms can be tried later together
+    with other batches. Otherwise their synonyms are tried at the end of this batch.
+
+    :param hits: Results paired with their synonyms.
+    :param settings: Settings to use.
+    :param library: Optional GeometryLibrary of optimized geometries.
+    :param failed: List collecting hits whose name failed.
+    :return: Iterator of results.
+    """
+    from datamolecule import batch_format
+
+    held: list[tuple[HitResult, list[str]]] = [] if failed is None else failed
+    structure_format = batch_format(settings.opsin_format)
+    reasons: dict[str, str] = {}
+    structures = resolve_names([result.name for result, _ in hits], settings, structure_format,
+                               reasons) if hits else []
+    for (result, synonyms), structure in zip(hits, structures):
+        if structure:
+            result.structure, result.structure_format = structure, structure_format
+            yield finish_hit(result, settings, library)
+        else:
+            # kept as the error in case no synonym works either
+            result.error = reasons.get(result.name)
+            held.append((result, synonyms))
+
+    if failed is None:
+        yield from resolve_synonyms(held, settings, library)
+
+
+def resolve_synonyms(hits: list[tuple[HitResult, list[str]]], settings: Settings,
+                     library=None) -> Iterator[HitResult]:
+    """
+    Second pass for hits whose name failed, trying the synonyms of every hit in one batch.
+
+    :param hits: Failed results paired with their synonyms.
+    :param settings: Settings to use.
+    :param library: Optional GeometryLibrary of optimized geometries.
+    :return: Iterator of results, successful or with an error.
+    """
+    from datamolecule import make_structures_from_synonyms
+
+    if not hits:
+        return
+    fallbacks = make_structures_from_synonyms([synonyms for _, synonyms in hits],
+                                              resolver=lambda batch: resolve_names(batch, settings, 'SMILES'))
+    for (result, _), fallback in zip(hits, fallbacks):
+        # the reason OPSIN gave for the name, recorded by resolve_hits
+        reason, result.error = result.error, None
+        if fallback is None:
+            result.error = 'OPSIN could not convert the name or any synonym' + (f': {reason}' if reason else '')
+            yield result
+            continue
+        result.synonym, result.structure = fallback
+        result.structure_format = 'SMILES'
+        yield finish_hit(result, settings, library)
+
+
+def open_library(settings: Settings):
+    """  Opens the geometry library named in settings, or returns None when there is none.  """
+    if settings.geometry_library is not None and os.path.isfile(settings.geometry_library):
+        from harvest import GeometryLibrary
+        return GeometryLibrary(str(settings.geometry_library))
+    return None
+
+
+def generate(source: str | os.PathLike | TextIO = None, settings: Settings = None,
+             peaks: Iterable[object] = None) -> Iterator[HitResult]:
+    """
+    Yields a HitResult for every proposed molecule of a report as soon as it is ready.
+
+    The names of each peak are converted in one OPSIN call and finished molecules are yielded right away. Molecules
+    whose name failed are held back until every peak is done, then their synonyms are tried in one batch and the
+    results, successful or not, are yielded last.
+
+    :param source: Path of a report or a text stream. Not needed when peaks is given.
+    :param settings: Settings to use, defaults to a copy of the global configuration.
+    :param peaks: Already parsed peaks, e.g. merged replicates, to use instead of reading source.
+    :return: Iterator of results.
+    :raises datamolecule.OpsinError: If OPSIN could not be run.
+    """
+    if settings is None:
+        settings = Settings.from_config()
+    if peaks is None:
+        peaks = read_peaks(source, settings)
+
+    library = open_library(settings)
+    failed: list[tuple[HitResult, list[str]]] = []
+    try:
+        for peak in peaks:
+            yield from resolve_hits(peak_hits(peak), settings, library, failed)
+        yield from resolve_synonyms(failed, settings, library)
+    finally:
+        if library is not None:
+            library.close()
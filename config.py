@@ -9,6 +9,7 @@ class Config:
     config_path: str
     filename: str
     output: pathlib.Path
+    geometry_library: pathlib.Path
 
     # Internal settings
     mol_id_start = int()
@@ -74,6 +75,8 @@ class Config:
         # all variables to read from file into config class
         self.filename = config['Environment']['input file']
         self.output = pathlib.Path(config['Environment']['output dir'])
+        self.geometry_library = pathlib.Path(config.get('Environment', 'geometry library',
+                                                        fallback='./geometries.sqlite'))
 
         # OPSIN Settings
         self.opsin_format = config['OPSIN']['output format']
@@ -103,6 +106,7 @@ class Config:
         config['Environment'] = {
             "Input File": './input.txt',
             "Output Dir": './output/',
+            "Geometry Library": './geometries.sqlite',
         }
         config['OPSIN'] = {
             "Output Format": 'SMILES',
@@ -1,5 +1,12 @@
+import glob
 import logging
-from typing import Literal
+import os
+import subprocess
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Literal
 
 from openbabel import openbabel, pybel
 from py2opsin import py2opsin as opsin
@@ -8,6 +15,19 @@ from config import cfg
 
 data_logger = logging.getLogger('GCMSpyDFT.datamolecule')
 
+# OPSIN output formats and the matching openbabel input formats
+PYBEL_FORMATS = {"SMILES": "smi", "ExtendedSMILES": "smi", "CML": "cml", "InChI": "inchi", "StdInChI": "inchi"}
+# OPSIN formats and the matching OPSIN command line output option
+OPSIN_OUTPUTS = {"SMILES": "smi", "ExtendedSMILES": "extendedsmi", "CML": "cml", "InChI": "inchi",
+                 "StdInChI": "stdinchi", "StdInChIKey": "stdinchikey"}
+# OPSIN formats with one line per name that openbabel can read back, so they can be converted in batches
+BATCH_FORMATS = ("SMILES", "ExtendedSMILES", "InChI", "StdInChI")
+
+
+def batch_format(out_format: str) -> str:
+    """  The format to convert a batch of names in, out_format when possible or else SMILES.  """
+    return out_format if out_format in BATCH_FORMATS else 'SMILES'
+
 
 def make_structure(names: str | list,
                    out_format: Literal[
@@ -36,16 +56,182 @@ def make_structure(names: str | list,
         wildcard_radicals=cfg.wildcard_radicals)
 
 
+def opsin_jar() -> str | None:
+    """  Path of the OPSIN jar shipped with py2opsin, or None if it can not be found.  """
+    import py2opsin
+    jars = glob.glob(os.path.join(os.path.dirname(py2opsin.__file__), '**', '*opsin*.jar'), recursive=True)
+    return max(jars) if jars else None
+
+
+class OpsinError(RuntimeError):
+    """  OPSIN itself failed, e.g. java is missing or crashed, as opposed to OPSIN rejecting a name.  """
+
+
+def opsin_errors(names: list[str], structures: list[str], stderr: str) -> dict[str, str]:
+    """
+    Pairs the names OPSIN could not convert with the reasons it wrote to stderr, one line per failed name in input
+    order. Anything written before them, e.g. JVM warnings, is skipped, and nothing is paired if lines are missing.
+    """
+    failed = [name for name, structure in zip(names, structures) if not structure]
+    messages = [line.strip() for line in stderr.splitlines() if line.strip()]
+    if not failed or len(messages) < len(failed):
+        return {}
+    return dict(zip(failed, messages[len(messages) - len(failed):]))
+
+
+def run_opsin(names: list[str], out_format: str = 'SMILES', acid: bool = False, radicals: bool = False,
+              bad_stereo: bool = False, wildcard_radicals: bool = False,
+              errors: dict[str, str] = None) -> list[str]:
+    """
+    Converts names to structures with a single OPSIN call.
+
+    The OPSIN jar is run directly with its own temporary file, so unlike py2opsin no warnings are raised and the
+    working directory is left alone, which keeps concurrent calls from different threads independent.
+
+    :param names: Names to convert.
+    :param out_format: One of BATCH_FORMATS.
+    :param acid: Allow acids without the acid suffix.
+    :param radicals: Allow radicals.
+    :param bad_stereo: Allow stereo that can not be interpreted.
+    :param wildcard_radicals: Output radicals as wildcard atoms.
+    :param errors: Filled with the reason OPSIN gave for each name it could not convert. py2opsin only warns, so
+                   there are no reasons without the jar.
+    :return: Structure for each name, empty where OPSIN could not convert it.
+    :raises OpsinError: If OPSIN could not be run or did not answer for every name.
+    """
+    if out_format not in BATCH_FORMATS:
+        raise ValueError(f'{out_format} does not give one line per name, use one of {", ".join(BATCH_FORMATS)}')
+
+    jar = opsin_jar()
+    if jar is None:
+        data_logger.debug('OPSIN jar not found, calling py2opsin.')
+        structures = opsin(chemical_name=names, output_format=out_format, allow_acid=acid, allow_radicals=radicals,
+                           allow_bad_stereo=bad_stereo, wildcard_radicals=wildcard_radicals,
+                           tmp_fpath=os.path.join(tempfile.gettempdir(), f'gcmspydft-{uuid.uuid4().hex}.txt'))
+        if not isinstance(structures, list) or len(structures) != len(names):
+            raise OpsinError(f'py2opsin did not return a result for each of {len(names)} names')
+        return structures
+
+    command = ['java', '-jar', jar, '-o' + OPSIN_OUTPUTS[out_format]]
+    command += [flag for flag, enabled in (('-a', acid), ('-r', radicals), ('-s', bad_stereo),
+                                           ('-w', wildcard_radicals)) if enabled]
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as names_file:
+        names_file.write('\n'.join(names) + '\n')
+    try:
+        completed = subprocess.run(command + [names_file.name], capture_output=True, text=True, encoding='utf-8')
+    except OSError as e:
+        raise OpsinError(f'Could not run OPSIN: {e}') from e
+    finally:
+        os.remove(names_file.name)
+
+    # every name gets a line, empty when it failed, and the reasons go to stderr
+    structures = completed.stdout.splitlines()
+    if completed.returncode != 0 or len(structures) != len(names):
+        raise OpsinError(f'OPSIN exited with {completed.returncode} and returned {len(structures)} lines for '
+                         f'{len(names)} names: {completed.stderr.strip()[-500:]}')
+    if errors is not None:
+        errors.update(opsin_errors(names, structures, completed.stderr))
+    return structures
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 256):
+        """
+        Dictionary that forgets the least recently used entries once it holds more than maxsize items.
+        Safe to share between threads.
+
+        :param maxsize: Largest number of entries kept.
+        """
+        self.maxsize = maxsize
+        self.data: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __contains__(self, key) -> bool:
+        return key in self.data
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def put(self, key, value) -> None:
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+
+# kept warm between reports when running as a watcher
+structure_cache = LRUCache(1024)  # (name, format, OPSIN flags): structure, empty if OPSIN failed
+error_cache = LRUCache(1024)      # (name, format, OPSIN flags): reason OPSIN gave for a failed name
+geometry_cache = LRUCache(256)    # (format, structure): Geometry of the 3D embedding and InChIKey
+
+
+def make_structures_from_synonyms(synonym_lists: list[list[str]],
+                                  resolver: Callable[[list[str]], list[str]] = None) -> list[tuple[str, str] | None]:
+    """
+    Fallback resolution for molecules whose chosen name failed to form a structure.
+
+    Formula-like synonyms are tried with the local condensed formula parser first. All remaining synonyms of every
+    molecule are then sent to OPSIN in one batched call. For each molecule the first synonym, in listed order, that
+    formed a structure is used.
+
+    :param synonym_lists: Alternative names for each failed molecule.
+    :param resolver: Converts a list of names to SMILES in one call, defaults to run_opsin.
+    :return: For each molecule a tuple of the synonym used and its SMILES, or None if all synonyms failed.
+    """
+    from formula import condensed_to_smiles
+
+    structures: dict[str, str] = {}
+    batch: list[str] = []
+    queued: set[str] = set()
+    for synonyms in synonym_lists:
+        for synonym in synonyms:
+            if synonym in structures or synonym in queued:
+                continue
+            if smiles := condensed_to_smiles(synonym):
+                structures[synonym] = smiles
+            else:
+                batch.append(synonym)
+                queued.add(synonym)
+
+    if batch:
+        data_logger.info('Resolving %d synonyms in one batch.', len(batch))
+        if resolver is not None:
+            results = resolver(batch)
+        else:
+            results = run_opsin(batch, 'SMILES', cfg.acid, cfg.radicals, cfg.bad_stereo, cfg.wildcard_radicals)
+        if results and len(results) == len(batch):
+            structures.update((synonym, result) for synonym, result in zip(batch, results) if result)
+        else:
+            data_logger.warning('Batched synonym resolution returned %s results for %d names.',
+                                len(results) if results else 'no', len(batch))
+
+    return [next(((synonym, structures[synonym]) for synonym in synonyms if synonym in structures), None)
+            for synonyms in synonym_lists]
+
+
 class DataMolecule(pybel.Molecule):
     def __init__(self, name: str, OBMol: openbabel.OBMol = None, structure: str = None, reference_num: int = None,
-                 cas_num: int = None, quality: int = None):
-        self.logger = logging.getLogger('GCMSpyDFT.molecule.Molecule')
-        self.logger.info(f'Creating new {name} molecule instance.')
+                 cas_num: int = None, quality: int = None, structure_format: str = 'CML'):
+        data_logger.info('Creating new %s molecule instance.', name)
 
         self.name = name
         self.name_no_space = self.name.strip().replace(' ', '_')
         self.structure: str = structure
-        self.mol = pybel.readstring('cml', make_structure(self.name, 'CML'))
+        if structure is not None:
+            if structure_format not in PYBEL_FORMATS:
+                raise ValueError(f'{structure_format} structures can not be read by openbabel, '
+                                 f'use one of {", ".join(PYBEL_FORMATS)}')
+            self.mol = pybel.readstring(PYBEL_FORMATS[structure_format], structure)
+        else:
+            self.mol = pybel.readstring('cml', make_structure(self.name, 'CML'))
         self.reference_num: int = reference_num  # reference number of molecule
         self.cas_num: int = cas_num  # CAS numbers of molecule
         self.quality: int = quality  # quality of molecule
@@ -53,14 +239,10 @@ class DataMolecule(pybel.Molecule):
         # For the love of all that is good I cannot understand this, but it seems to work
         # FIXME: This needs a cleaning
         if OBMol is not None:
-            self.logger.debug(f'Openbabel object provided for {name}')
+            data_logger.debug('Openbabel object provided for %s', name)
             super().__init__(OBMol)
         else:
-            self.logger.debug(f'Generating molecule object for {name}')
-            try:
-                structure = make_structure(self.name, 'CML')
-            except Warning:
-                self.logger.error(f'Molecule {self.reference_num} failed to from a structure')
+            data_logger.debug('Generating molecule object for %s', name)
             super().__init__(self.mol)
 
     def name_strip(self):
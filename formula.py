@@ -0,0 +1,108 @@
+import re
+
+VALENCE = {'C': 4, 'N': 3, 'O': 2, 'S': 2, 'P': 3, 'F': 1, 'Cl': 1, 'Br': 1, 'I': 1}
+BOND_ORDERS = {'-': 1, '=': 2, '#': 3}
+BOND_SYMBOLS = {1: '', 2: '=', 3: '#'}
+
+# an atom with optional hydrogens and count, hydrogens after a count belong to the last atom (CO2H), or a bond symbol
+TOKEN = re.compile(r'(Cl|Br|[CNOSPFI])(H\d*)?(\d*)(H\d*)?|([-=#])')
+# repeated group such as (CH2)4
+REPEAT = re.compile(r'\(([^()]+)\)(\d+)')
+
+
+def tokenize(formula: str) -> list[list] | None:
+    """
+    Splits a condensed formula into atoms, each as [element, hydrogens, bond order to previous atom or None].
+
+    :param formula: Condensed structural formula e.g. 'CH2=CHCHO'.
+    :return: List of atoms or None if the formula can not be read.
+    """
+    text = REPEAT.sub(lambda match: match[1] * int(match[2]), formula.strip())
+    atoms: list[list] = []
+    bond = None
+    pos = 0
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None:
+            return None
+        pos = match.end()
+        element, hydrogens, count, last_hydrogens, symbol = match.groups()
+
+        if symbol:
+            if bond is not None or not atoms:
+                return None
+            bond = BOND_ORDERS[symbol]
+            continue
+
+        h_count = 0 if hydrogens is None else int(hydrogens[1:] or 1)
+        last_h_count = 0 if last_hydrogens is None else int(last_hydrogens[1:] or 1)
+        atom_count = int(count or 1)
+        # only halogens and bare oxygens (e.g. CO2H) can be counted, anything else is ambiguous
+        if (atom_count > 1 and (h_count or VALENCE[element] > 2)) or (last_hydrogens and not count):
+            return None
+        for n in range(atom_count):
+            atoms.append([element, h_count if n < atom_count - 1 else h_count + last_h_count, bond])
+            bond = None
+
+    if bond is not None:
+        return None
+    return atoms
+
+
+def condensed_to_smiles(formula: str) -> str | None:
+    """
+    Cheap local parser for linear condensed formulas found in synonym lists, e.g. 'CH2=CHCHO' or 'CH3COOCH3'.
+
+    Atoms are chained in order with bond orders taken from the remaining valence of each atom. Halogens become
+    branches and a bare oxygen inside the chain becomes a carbonyl when the previous atom has room for it. Every atom
+    must end up with a full valence, so anything ambiguous is rejected rather than guessed.
+
+    :param formula: Condensed structural formula.
+    :return: SMILES string or None if the formula is not understood.
+    """
+    atoms = tokenize(formula)
+    if not atoms or not any(atom[0] == 'C' for atom in atoms):
+        return None
+
+    smiles = ''
+    free = 0
+    i = 0
+    while i < len(atoms):
+        element, h_count, bond = atoms[i]
+        if i:
+            order = bond or free
+            if order not in BOND_SYMBOLS or (bond is not None and bond != free):
+                return None
+            smiles += BOND_SYMBOLS[order]
+        else:
+            order = 0
+
+        free = VALENCE[element] - h_count - order
+        smiles += element
+        i += 1
+
+        # absorb branches hanging off the current atom
+        while i < len(atoms) and atoms[i][2] is None:
+            next_element, next_h, _bond = atoms[i]
+            if VALENCE[next_element] == 1 and free >= 1:
+                smiles += f'({next_element})'
+                free -= 1
+            elif next_element == 'O' and not next_h and i + 1 < len(atoms) and free >= 3:
+                smiles += '(=O)'
+                free -= 2
+            else:
+                break
+            i += 1
+
+        if free < 0:
+            return None
+
+    if free:
+        return None
+    return smiles
+
+
+if __name__ == '__main__':
+    for test_formula in ['CH2=CHCHO', 'CH3CH2OH', 'CH3COOH', 'CH3CO2H', 'CH3COOCH3', 'CH3CN', 'CHCl3',
+                         'CH3(CH2)4CH3', '(E)-2-C4H8', 'NSC 8819', 'Propenal']:
+        print(test_formula, condensed_to_smiles(test_formula))
@@ -0,0 +1,192 @@
+import struct
+from array import array
+
+# element symbols by atomic number, so geometries can be written without loading openbabel
+SYMBOLS = ['X',
+           'H', 'He',
+           'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne',
+           'Na', 'Mg', 'Al', 'Si', 'P', 'S', 'Cl', 'Ar',
+           'K', 'Ca', 'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr',
+           'Rb', 'Sr', 'Y', 'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'I', 'Xe',
+           'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er', 'Tm', 'Yb', 'Lu',
+           'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi', 'Po', 'At', 'Rn',
+           'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'U', 'Np', 'Pu', 'Am', 'Cm', 'Bk', 'Cf', 'Es', 'Fm', 'Md', 'No', 'Lr',
+           'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn', 'Nh', 'Fl', 'Mc', 'Lv', 'Ts', 'Og']
+NUMBERS = {symbol: number for number, symbol in enumerate(SYMBOLS)}
+
+# atom count, charge, multiplicity and name length, followed by the name, atomic numbers and coordinates
+HEADER = struct.Struct('<IiiI')
+
+
+class Geometry:
+    __slots__ = ('numbers', 'coords', 'charge', 'multiplicity', 'name')
+
+    def __init__(self, numbers, coords, charge: int = 0, multiplicity: int = 1, name: str = ''):
+        """
+        Lightweight molecule geometry that can be pickled, sent between processes or placed in shared memory.
+        Openbabel is only needed to convert to and from an OBMol.
+
+        :param numbers: Atomic number of each atom.
+        :param coords: Cartesian coordinates in Angstrom, either N rows of (x, y, z) or a flat sequence of 3N values.
+        :param charge: Total charge.
+        :param multiplicity: Spin multiplicity.
+        :param name: Name of the molecule.
+        """
+        self.numbers = array('H', numbers)
+        flat = array('d')
+        for value in coords:
+            if isinstance(value, (int, float)):
+                flat.append(value)
+            else:
+                flat.extend(value)
+        if len(flat) != 3 * len(self.numbers):
+            raise ValueError(f'Expected {3 * len(self.numbers)} coordinates, got {len(flat)}')
+        self.coords = flat
+        self.charge = charge
+        self.multiplicity = multiplicity
+        self.name = name
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __repr__(self) -> str:
+        return (f'{self.__class__.__name__}(name={self.name!r}, atoms={len(self)}, '
+                f'charge={self.charge}, multiplicity={self.multiplicity})')
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Geometry):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def position(self, i: int) -> tuple[float, float, float]:
+        """  Coordinates of atom i.  """
+        return self.coords[3 * i], self.coords[3 * i + 1], self.coords[3 * i + 2]
+
+    def positions(self) -> list[tuple[float, float, float]]:
+        """  Coordinates as an N by 3 list of rows.  """
+        return [self.position(i) for i in range(len(self))]
+
+    def symbols(self) -> list[str]:
+        return [SYMBOLS[number] for number in self.numbers]
+
+    def renamed(self, name: str) -> 'Geometry':
+        """  Copy with another name, changing its coordinates leaves this geometry alone.  """
+        copy = Geometry.__new__(Geometry)
+        copy.numbers, copy.coords = array('H', self.numbers), array('d', self.coords)
+        copy.charge, copy.multiplicity, copy.name = self.charge, self.multiplicity, name
+        return copy
+
+    def to_xyz(self) -> str:
+        """  Geometry in xyz format.  """
+        lines = [str(len(self)), self.name]
+        for symbol, (x, y, z) in zip(self.symbols(), self.positions()):
+            lines.append(f'{symbol:<3}{x:15.5f}{y:15.5f}{z:15.5f}')
+        return '\n'.join(lines) + '\n'
+
+    def to_gaussian(self, keywords: str, title: str, charge: int = None, multiplicity: int = None) -> str:
+        """
+        Gaussian input in the layout of the openbabel gau writer, without going through an OBMol.
+
+        :param keywords: Link 0 and route sections.
+        :param title: Title section.
+        :param charge: Charge to write instead of the charge of the geometry.
+        :param multiplicity: Multiplicity to write instead of the multiplicity of the geometry.
+        :return: Text of the input file.
+        """
+        charge = self.charge if charge is None else charge
+        multiplicity = self.multiplicity if multiplicity is None else multiplicity
+        lines = [keywords, '', f' {title}', '', f'{charge}  {multiplicity}']
+        for symbol, (x, y, z) in zip(self.symbols(), self.positions()):
+            lines.append(f'{symbol:<3}      {x:10.5f}      {y:10.5f}      {z:10.5f} ')
+        return '\n'.join(lines) + '\n\n'
+
+    @classmethod
+    def from_xyz(cls, text: str, charge: int = 0, multiplicity: int = 1, name: str = None) -> 'Geometry':
+        """
+        Reads a geometry in xyz format.
+
+        :param text: xyz text.
+        :param charge: Total charge.
+        :param multiplicity: Spin multiplicity.
+        :param name: Name of the molecule, defaults to the comment line.
+        :return: New geometry.
+        """
+        lines = text.splitlines()
+        count = int(lines[0])
+        numbers, coords = [], []
+        for line in lines[2:2 + count]:
+            symbol, x, y, z = line.split()[:4]
+            numbers.append(int(symbol) if symbol.isdigit() else NUMBERS[symbol.capitalize()])
+            coords.extend((float(x), float(y), float(z)))
+        return cls(numbers, coords, charge, multiplicity, lines[1].strip() if name is None else name)
+
+    def to_bytes(self) -> bytes:
+        """  Packs the geometry into bytes, e.g. to copy into a multiprocessing.shared_memory block.  """
+        name = self.name.encode()
+        return (HEADER.pack(len(self), self.charge, self.multiplicity, len(name))
+                + name + self.numbers.tobytes() + self.coords.tobytes())
+
+    @classmethod
+    def from_bytes(cls, buffer) -> 'Geometry':
+        """  Unpacks a geometry packed by to_bytes from bytes or a buffer such as SharedMemory.buf.  """
+        view = memoryview(buffer)
+        count, charge, multiplicity, name_length = HEADER.unpack_from(view)
+        offset = HEADER.size
+        name = bytes(view[offset:offset + name_length]).decode()
+        offset += name_length
+        numbers = array('H')
+        numbers.frombytes(view[offset:offset + count * numbers.itemsize])
+        offset += count * numbers.itemsize
+        coords = array('d')
+        coords.frombytes(view[offset:offset + 3 * count * coords.itemsize])
+
+        geometry = cls.__new__(cls)
+        geometry.numbers, geometry.coords = numbers, coords
+        geometry.charge, geometry.multiplicity, geometry.name = charge, multiplicity, name
+        return geometry
+
+    @classmethod
+    def from_obmol(cls, obmol, name: str = None) -> 'Geometry':
+        """
+        Copies the atoms, coordinates, charge and multiplicity of an openbabel OBMol.
+
+        :param obmol: openbabel.OBMol or pybel.Molecule.
+        :param name: Name of the molecule, defaults to the title of the OBMol.
+        :return: New geometry.
+        """
+        from openbabel import openbabel
+
+        obmol = getattr(obmol, 'OBMol', obmol)
+        numbers, coords = [], []
+        for atom in openbabel.OBMolAtomIter(obmol):
+            numbers.append(atom.GetAtomicNum())
+            coords.extend((atom.GetX(), atom.GetY(), atom.GetZ()))
+        return cls(numbers, coords, obmol.GetTotalCharge(), obmol.GetTotalSpinMultiplicity(),
+                   obmol.GetTitle() if name is None else name)
+
+    def to_obmol(self):
+        """
+        Builds an openbabel OBMol, perceiving bonds from the coordinates. Only needed where openbabel itself is.
+
+        :return: New openbabel.OBMol.
+        """
+        from openbabel import openbabel
+
+        obmol = openbabel.OBMol()
+        obmol.BeginModify()
+        for number, (x, y, z) in zip(self.numbers, self.positions()):
+            atom = obmol.NewAtom()
+            atom.SetAtomicNum(number)
+            atom.SetVector(x, y, z)
+        obmol.EndModify()
+        obmol.ConnectTheDots()
+        obmol.PerceiveBondOrders()
+        obmol.SetTotalCharge(self.charge)
+        obmol.SetTotalSpinMultiplicity(self.multiplicity)
+        obmol.SetTitle(self.name)
+        return obmol
+
+    def to_pybel(self):
+        """  Builds a pybel.Molecule, see to_obmol.  """
+        from openbabel import pybel
+        return pybel.Molecule(self.to_obmol())
@@ -0,0 +1,191 @@
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+
+harvest_logger = logging.getLogger('GCMSpyDFT.harvest')
+
+NORMAL_TERMINATION = b'Normal termination of Gaussian'
+# written to the title of every input file, echoed near the top of the log
+RECORDED_INCHIKEY = re.compile(rb'InChIKey=([A-Z]{14}-[A-Z]{10}-[A-Z])')
+# second block of a standard InChIKey without stereo or isotope layers
+NO_STEREO = 'UHFFFAOYSA'
+
+
+class GeometryLibrary:
+    def __init__(self, path: str):
+        """
+        Local SQLite library of optimized geometries keyed by InChIKey.
+
+        :param path: Path of the library database, created if missing.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS geometries ('
+                                'inchikey TEXT PRIMARY KEY, '
+                                'name TEXT, '
+                                'xyz TEXT NOT NULL, '
+                                'source TEXT NOT NULL, '
+                                'modified REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS geometries_source ON geometries (source)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS geometries_connectivity '
+                                'ON geometries (substr(inchikey, 1, 14))')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM geometries').fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add(self, inchikey: str, xyz: str, source: str, modified: float, name: str = None) -> None:
+        """  Stores a geometry, replacing an older one for the same InChIKey.  """
+        self.connection.execute('INSERT INTO geometries (inchikey, name, xyz, source, modified) '
+                                'VALUES (?, ?, ?, ?, ?) '
+                                'ON CONFLICT (inchikey) DO UPDATE SET '
+                                'name = excluded.name, xyz = excluded.xyz, source = excluded.source, '
+                                'modified = excluded.modified '
+                                'WHERE excluded.modified >= geometries.modified',
+                                (inchikey, name, xyz, source, modified))
+        self.connection.commit()
+
+    def get(self, inchikey: str) -> str | None:
+        """
+        Returns the stored geometry as xyz text or None.
+
+        Structures without stereo, e.g. from names without stereodescriptors, fall back to the newest geometry with
+        the same connectivity, since keys made from 3D outputs carry the stereo perceived from the coordinates.
+        """
+        row = self.connection.execute('SELECT xyz FROM geometries WHERE inchikey = ?', (inchikey,)).fetchone()
+        if row is None and inchikey[15:25] == NO_STEREO:
+            row = self.connection.execute('SELECT xyz FROM geometries WHERE substr(inchikey, 1, 14) = ? '
+                                          'ORDER BY modified DESC LIMIT 1', (inchikey[:14],)).fetchone()
+        return row[0] if row else None
+
+    def is_current(self, source: str, modified: float) -> bool:
+        """  Checks if a file has already been harvested since it was last modified.  """
+        row = self.connection.execute('SELECT MAX(modified) FROM geometries WHERE source = ?', (source,)).fetchone()
+        return row[0] is not None and row[0] >= modified
+
+
+def finished_normally(path: str) -> bool:
+    """  Checks the end of a Gaussian output file for a normal termination line.  """
+    with open(path, 'rb') as output:
+        output.seek(0, os.SEEK_END)
+        output.seek(max(0, output.tell() - 4096))
+        return NORMAL_TERMINATION in output.read()
+
+
+def sibling_log(path: str, size: int = 65536) -> str | None:
+    """
+    Finds the log of the job that wrote a checkpoint file: a .log or .out file with the same name, or else one in the
+    same directory whose echoed input names the checkpoint file in its %chk line.
+    """
+    for extension in ('.log', '.out'):
+        log_path = os.path.splitext(path)[0] + extension
+        if os.path.isfile(log_path):
+            return log_path
+
+    directory, chk_name = os.path.split(path)
+    link0 = f'%chk={chk_name}'.lower().encode()
+    with os.scandir(directory or '.') as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(('.log', '.out')):
+                with open(entry.path, 'rb') as log:
+                    if link0 in log.read(size).lower():
+                        return entry.path
+    return None
+
+
+def recorded_inchikey(path: str, size: int = 65536) -> str | None:
+    """  Finds the InChIKey GCMSpyDFT wrote to the title of the input file, echoed at the start of the log.  """
+    with open(path, 'rb') as log:
+        match = RECORDED_INCHIKEY.search(log.read(size))
+    return match.group(1).decode() if match else None
+
+
+def read_final_geometry(path: str):
+    """
+    Reads the last geometry of a finished Gaussian log file or checkpoint file.
+
+    A checkpoint file is only read when the log next to it finished normally, since a crashed or unconverged job
+    leaves one behind too. It is converted with formchk first, so it is skipped when formchk is not on the path.
+
+    :param path: Gaussian .log, .out or .chk file.
+    :return: pybel molecule of the final geometry or None.
+    """
+    from openbabel import pybel
+
+    if path.endswith('.chk'):
+        log_path = sibling_log(path)
+        if log_path is None or not finished_normally(log_path):
+            harvest_logger.debug('No normally finished log next to %s, skipping', path)
+            return None
+        formchk = shutil.which('formchk')
+        if formchk is None:
+            harvest_logger.debug('formchk not found, skipping %s', path)
+            return None
+        with tempfile.TemporaryDirectory() as tmp:
+            fchk_path = os.path.join(tmp, 'harvest.fchk')
+            subprocess.run([formchk, path, fchk_path], check=True, capture_output=True)
+            return next(pybel.readfile('fchk', fchk_path), None)
+
+    if not finished_normally(path):
+        harvest_logger.debug('%s did not finish normally, skipping', path)
+        return None
+    molecule = None
+    for molecule in pybel.readfile('g09', path):
+        pass
+    return molecule
+
+
+def harvest(root: str, library: GeometryLibrary, extensions: tuple[str, ...] = ('.log', '.out', '.chk')) -> int:
+    """
+    Scans an output tree for finished Gaussian jobs and stores their final geometries in the library.
+
+    Files harvested since their last change are skipped, so the scan can be repeated cheaply.
+
+    :param root: Directory to scan.
+    :param library: Library to store geometries in.
+    :param extensions: File extensions of Gaussian outputs.
+    :return: Number of geometries stored.
+    """
+    stored = 0
+    for directory, _dirs, files in os.walk(root):
+        for file_name in files:
+            if not file_name.endswith(extensions):
+                continue
+            path = os.path.join(directory, file_name)
+            modified = os.path.getmtime(path)
+            if library.is_current(path, modified):
+                continue
+
+            try:
+                molecule = read_final_geometry(path)
+            except (OSError, subprocess.CalledProcessError) as e:
+                harvest_logger.warning('Could not read %s: %s', path, e)
+                continue
+            if molecule is None or not len(molecule.atoms):
+                continue
+
+            # prefer the key of the structure the input was made from, which is what later runs look up
+            log_path = sibling_log(path) if path.endswith('.chk') else path
+            inchikey = recorded_inchikey(log_path) or molecule.write('inchikey').strip()
+            if not inchikey:
+                harvest_logger.warning('Could not make an InChIKey for %s', path)
+                continue
+            library.add(inchikey, molecule.write('xyz'), path, modified, name=os.path.splitext(file_name)[0])
+            harvest_logger.info('Harvested %s from %s', inchikey, path)
+            stored += 1
+
+    harvest_logger.info('Stored %d geometries, library now holds %d', stored, len(library))
+    return stored
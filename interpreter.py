@@ -1,3 +1,6 @@
+import mmap
+import os
+from array import array
 from io import TextIOWrapper
 from pprint import pprint
 
@@ -71,6 +74,114 @@ def peak_agg(lines: list) -> list[list[str]]:  # TODO: Might switch to a recursi
     return blocks
 
 
+def index_path(path: str) -> str:
+    """  Path of the sidecar file the peak index of a report is stored in.  """
+    return path + '.peakindex'
+
+
+def index_key(path: str, sep: str) -> bytes:
+    """  First line of a sidecar index, which must match for the index to be reused.  """
+    stat = os.stat(path)
+    return f'peakindex 1 {stat.st_size} {stat.st_mtime_ns} {sep}\n'.encode()
+
+
+def load_index(path: str, sep: str = "___") -> list[int] | None:
+    """  Reads the sidecar index of a report, or None if it is missing or the report changed since.  """
+    try:
+        with open(index_path(path), 'rb') as index_file:
+            if index_file.readline() != index_key(path, sep):
+                return None
+            offsets = array('q')
+            offsets.frombytes(index_file.read())
+    except (OSError, ValueError):
+        return None
+    return offsets.tolist()
+
+
+def save_index(path: str, offsets: list[int], sep: str = "___") -> None:
+    """  Writes the sidecar index of a report, skipped quietly when the report's directory is read only.  """
+    temp_path = index_path(path) + '.tmp'
+    try:
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(index_key(path, sep))
+            index_file.write(array('q', offsets).tobytes())
+        os.replace(temp_path, index_path(path))
+    except OSError:
+        pass
+
+
+def index_peaks(path: str, sep: str = "___", cache: bool = True) -> list[int]:
+    """
+    Builds an index of the byte offsets where each peak starts without reading the whole file into memory.
+
+    The file is memory-mapped and only the start of each line is checked with is_peak_line. Lines before the header
+    separator are skipped, the same as trim_header. The end of the file is appended so peak n spans
+    offsets[n]:offsets[n + 1].
+
+    The index is stored next to the report in a .peakindex file keyed by the report's size and modification time,
+    so later runs, e.g. picking single peaks with --peaks, skip the scan until the report changes.
+
+    :param path: Path of the GC-MS report.
+    :param sep: Separator marking the end of the header.
+    :param cache: Reuse and write the sidecar index.
+    :return: List of peak start offsets followed by the file size.
+    """
+    if cache and (offsets := load_index(path, sep)) is not None:
+        return offsets
+    offsets = scan_peaks(path, sep)
+    if cache:
+        save_index(path, offsets, sep)
+    return offsets
+
+
+def scan_peaks(path: str, sep: str = "___") -> list[int]:
+    """  Scans a report for peak start offsets, see index_peaks.  """
+    with open(path, 'rb') as file:
+        if not file.seek(0, 2):
+            return [0]
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            header_end = mm.find(sep.encode())
+            if header_end == -1:
+                pos = 0
+            else:
+                pos = mm.find(b'\n', header_end)
+                pos = size if pos == -1 else pos + 1
+
+            offsets = []
+            while pos < size:
+                end = mm.find(b'\n', pos)
+                if end == -1:
+                    end = size
+                if is_peak_line(mm[pos:min(end, pos + 3)].decode('latin-1')):
+                    offsets.append(pos)
+                pos = end + 1
+            offsets.append(size)
+    return offsets
+
+
+def read_peak_blocks(path: str, offsets: list[int], start: int = 0, stop: int = None,
+                     encoding: str = 'utf-8') -> list[list[str]]:
+    """
+    Reads peak blocks straight from their offsets, allowing any range of peaks to be read in any order.
+
+    :param path: Path of the GC-MS report.
+    :param offsets: Index made by index_peaks.
+    :param start: Index of the first peak to read.
+    :param stop: Index after the last peak to read, defaults to the last peak.
+    :param encoding: Text encoding of the report.
+    :return: List of peak block lists.
+    """
+    if stop is None:
+        stop = len(offsets) - 1
+    blocks = []
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for n in range(start, stop):
+            block = mm[offsets[n]:offsets[n + 1]].decode(encoding, errors='replace').splitlines()
+            blocks.append(block)
+    return blocks
+
+
 if __name__ == '__main__':
     read_lines = read_to_list("test/test_file.txt")
     trimmed_lines = trim_header(read_lines, content_finder(read_lines))
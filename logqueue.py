@@ -0,0 +1,264 @@
+import atexit
+import contextlib
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import re
+
+ANSI_ESCAPE = re.compile(r'\033\[[0-9;]*m')
+
+
+class PlainFormatter(logging.Formatter):
+    """
+    Formatter that removes the terminal color codes used in console messages.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        return ANSI_ESCAPE.sub('', super().format(record))
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object per line for machine parsing. Values passed through the ``extra``
+    argument of a logging call are included under ``data``.
+    """
+    reserved = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': ANSI_ESCAPE.sub('', record.getMessage()),
+        }
+        data = {key: value for key, value in vars(record).items() if key not in self.reserved}
+        if data:
+            event['data'] = data
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+class BatchFileHandler(logging.FileHandler):
+    """
+    File handler that leaves flushing to the listener, which flushes whenever the queue runs empty, instead of
+    flushing after every record.
+    """
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """
+    Listener that flushes its handlers each time it has caught up with the queue.
+    """
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get(block=False)
+        except queue.Empty:
+            for handler in self.handlers:
+                handler.flush()
+            return self.queue.get(block=block)
+
+
+class ThreadQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler for a queue read by a thread of the same process. Records are not pickled, so only the message is
+    merged with its arguments in the calling thread, without the copy and formatting QueueHandler does for pickling.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+
+def start_logging(verbosity: bool = False, quiet: bool = False, log_file: str = 'GCMSpyDFT.log',
+                  file_level: int = logging.DEBUG, json_file: str = None,
+                  name: str = 'GCMSpyDFT') -> logging.handlers.QueueListener:
+    """
+    Sends all records of the named logger through a queue to a background listener thread, so the file, console
+    and JSON lines handlers never block the calling code. Worker processes join in through pool_logging.
+
+    The logger level is set to the lowest level any handler accepts, so ``logger.isEnabledFor`` can be used to skip
+    building records nobody will see.
+
+    :param verbosity: Show info messages on the console.
+    :param quiet: Show nothing on the console.
+    :param log_file: Path of the plain text log file.
+    :param file_level: Lowest level written to the log file and JSON lines file.
+    :param json_file: Optional path of a JSON lines event file.
+    :param name: Name of the logger to set up.
+    :return: The running listener, which is also stopped at exit.
+    """
+    handlers: list[logging.Handler] = []
+
+    # create file handler which logs even debug messages
+    fh = BatchFileHandler(log_file, mode='w')
+    fh.setLevel(file_level)
+    fh.setFormatter(PlainFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handlers.append(fh)
+
+    # create console handler
+    ch = logging.StreamHandler()
+    ch.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    if verbosity:
+        ch.setLevel(logging.INFO)
+    elif quiet:
+        ch.setLevel(logging.CRITICAL + 1)
+    else:
+        ch.setLevel(logging.WARNING)
+    handlers.append(ch)
+
+    if json_file is not None:
+        jh = BatchFileHandler(json_file, mode='w')
+        jh.setLevel(file_level)
+        jh.setFormatter(JsonLinesFormatter())
+        handlers.append(jh)
+
+    # thread only queue, cheap to put on, worker processes are connected with pool_logging
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = BatchQueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    logger_setup = logging.getLogger(name)
+    for handler in list(logger_setup.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logger_setup.removeHandler(handler)
+    logger_setup.setLevel(min(handler.level for handler in handlers))
+    logger_setup.addHandler(ThreadQueueHandler(log_queue))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def stop_logging(listener: logging.handlers.QueueListener) -> None:
+    """  Flushes the queue, stops the listener thread and closes its handlers.  """
+    atexit.unregister(listener.stop)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+@contextlib.contextmanager
+def pool_logging(name: str = 'GCMSpyDFT'):
+    """
+    Connects the workers of a process pool to the handlers of the named logger while the pool runs, e.g.
+
+        with pool_logging() as initargs, ProcessPoolExecutor(initializer=init_worker_logging, initargs=initargs):
+
+    Worker records arrive through a process safe queue and are passed on to the logger's own handlers, so the single
+    process path keeps its cheaper thread only queue.
+
+    :param name: Name of the logger the workers log to.
+    :return: Arguments for init_worker_logging.
+    """
+    logger_setup = logging.getLogger(name)
+    if not logger_setup.handlers:
+        yield None, logger_setup.level, name
+        return
+
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *logger_setup.handlers)
+    listener.start()
+    try:
+        yield log_queue, logger_setup.level, name
+    finally:
+        listener.stop()
+        log_queue.close()
+        log_queue.join_thread()
+
+
+def init_worker_logging(log_queue, level: int, name: str = 'GCMSpyDFT') -> None:
+    """
+    Pool initializer that sends the records of a worker process to the listener of the parent process.
+
+    :param log_queue: Queue of the parent listener, or None to leave logging untouched.
+    :param level: Level of the parent logger.
+    :param name: Name of the logger to set up.
+    """
+    if log_queue is None:
+        return
+    logger_setup = logging.getLogger(name)
+    for handler in list(logger_setup.handlers):
+        logger_setup.removeHandler(handler)
+    logger_setup.setLevel(level)
+    logger_setup.addHandler(ThreadQueueHandler(log_queue))
+
+
+def benchmark(peak_count: int = 2000) -> dict[str, tuple[float, float]]:
+    """
+    Times parsing of a generated report at each log level, against the synchronous file handler used before the
+    queue as a baseline.
+
+    :param peak_count: Number of peaks in the generated report.
+    :return: Seconds spent by the parsing code and seconds until every record was written, keyed by setup.
+    """
+    import os
+    import tempfile
+    import time
+
+    import peaks
+
+    block = ['  1   3.474  0.00 C:\\Database\\WILEY275.L',
+             '                 2-Propenal (CAS) $$ Acrolein $$ NS    401 000107-02-8  4',
+             '                 C 8819 $$ Aqualin $$ Propenal $$ A',
+             '                 crylaldehyde $$ Allyl aldehyde $$ ',
+             '                 2-Butene, (E)- (CAS) $$ trans-2-Bu    1429 000624-64-6  3',
+             '                 tene $$ (E)-2-Butene $$ trans-Bute',
+             '                 ISO BUTYRALDEHYDE                    1475 000078-84-2 72',
+             '                 11-Oxatricyclo(5.4.1.0)dodecan-9-o  64703 073274-37-0 37',
+             '                 ne']
+    levels = {
+        'disabled': logging.CRITICAL + 1,
+        'warning': logging.WARNING,
+        'info': logging.INFO,
+        'debug': logging.DEBUG,
+    }
+
+    def parse() -> float:
+        start = time.perf_counter()
+        for _ in range(peak_count):
+            peak = peaks.Peak(list(block))
+            peak.peak_header()
+            peak.left_align()
+            peak.add_separator(use_config=False)
+            peak.combine_lines()
+            peak.parse_lines()
+        return time.perf_counter() - start
+
+    timings = {}
+    logger_setup = logging.getLogger('GCMSpyDFT')
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ('info', 'debug'):
+            # the baseline, a file handler called by the parsing code itself
+            handler = logging.FileHandler(os.path.join(tmp, f'sync-{label}.log'), mode='w')
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            previous = logger_setup.handlers[:], logger_setup.level
+            logger_setup.handlers = [handler]
+            logger_setup.setLevel(levels[label])
+            start = time.perf_counter()
+            caller = parse()
+            handler.close()
+            timings[f'synchronous {label}'] = caller, time.perf_counter() - start
+            logger_setup.handlers, logger_setup.level = previous
+
+        for label, level in levels.items():
+            listener = start_logging(quiet=True, log_file=os.path.join(tmp, f'{label}.log'), file_level=level,
+                                     name='GCMSpyDFT')
+            start = time.perf_counter()
+            caller = parse()
+            stop_logging(listener)
+            timings[f'queue {label}'] = caller, time.perf_counter() - start
+    return timings
+
+
+if __name__ == '__main__':
+    print(f'{"setup":>17}  {"parsing":>9}  {"written":>9}')
+    for setup, (parsing, written) in benchmark().items():
+        print(f'{setup:>17}  {parsing:8.3f}s  {written:8.3f}s')
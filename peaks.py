@@ -1,6 +1,6 @@
 import logging
 import re
-from typing import Callable
+from typing import Callable, NamedTuple
 
 # import molecule
 from config import cfg
@@ -8,6 +8,14 @@ from config import cfg
 peak_logger = logging.getLogger('GCMSpyDFT.peak')
 
 
+class Layout(NamedTuple):
+    """
+    Column layout of the reference lines in one report. Immutable so it can be shared between processes.
+    """
+    ref_start: int  # position of reference number and start of tailing values
+    id_stop: int    # length to cut molecule IDs to
+
+
 class Peak:
     def __init__(self, peak_lines: list[str]):
         """
@@ -28,6 +36,9 @@ class Peak:
         self.reference_nums: list[int] = []  # list of all reference numbers in peak
         self.cas_nums: list[int] = []        # list of all CAS numbers in peak
         self.qualities: list[int] = []        # list of all qualities in peak
+        self.replicate_count: int = 1         # number of replicate runs the peak was found in
+        self.hit_replicates: list[int] = []   # number of replicate runs each molecule was found in
+        self.synonyms: list[list[str]] = []   # other names listed for each molecule in peak
 
     def __str__(self) -> str:
         """
@@ -66,10 +77,11 @@ class Peak:
             # edit block in place
             block[i + 1] = line[line_indent:]
 
-    def add_separator(self, separator: str = ' @ ', id_stop: int = None, ref_start: int = None) -> None:
+    def add_separator(self, separator: str = ' @ ', id_stop: int = None, ref_start: int = None,
+                      layout: Layout = None, use_config: bool = True) -> Layout:
         """
         Will guess where to add a separator between molecule ids and tailing values on each reference line if no
-        configuration setting or id_stop and ref_start parameters are found.
+        layout, configuration setting or id_stop and ref_start parameters are found.
 
         Guessing is done by checking the first line for the index of a reference 3 digits long then updating the
         index whenever a smaller reference number index is found.
@@ -77,6 +89,10 @@ class Peak:
         :param id_stop: Length to cut molecule IDs to.
         :param ref_start: Position of reference number and start of tailing values.
         :param separator: The character used to distinguish between molecule IDs and tailing values.
+        :param layout: Layout to use instead of the configuration settings. The configuration is left untouched.
+        :param use_config: Whether the column layout is read from the configuration, and a guessed or passed layout
+            written back to it for later peaks.
+        :return: The layout used for the peak.
         """
         # copy block
         block = self.peak_block
@@ -87,13 +103,17 @@ class Peak:
         elif ref_start is not None and id_stop is None:
             raise ValueError('Value for id_stop must be passed if a value for ref_start is passed')
         elif ref_start is not None and id_stop is not None:
-            cfg.ref_num_start, cfg.mol_id_stop = ref_start, id_stop
+            layout = Layout(ref_start, id_stop)
+            if use_config:
+                cfg.ref_num_start, cfg.mol_id_stop = ref_start, id_stop
         # if column values are specified in config instance
-        if cfg.ref_num_start and cfg.mol_id_stop:
+        if layout is None and use_config and cfg.ref_num_start and cfg.mol_id_stop:
             self.logger.debug("Found config values.")
+            layout = Layout(cfg.ref_num_start, cfg.mol_id_stop)
+
+        if layout is not None:
             # could add logic for cfg.mol_id_start
-            ref_start = cfg.ref_num_start
-            id_stop = cfg.mol_id_stop
+            ref_start, id_stop = layout
 
             for i, line in enumerate(block[1:]):
                 if len(line) > id_stop:
@@ -123,7 +143,11 @@ class Peak:
                     # extend in place
                     block[i + 1] = line.ljust(id_stop)
 
-            cfg.ref_num_start, cfg.mol_id_stop = ref_start, id_stop  # I don't think I need this here
+            layout = Layout(ref_start, id_stop)
+            if use_config:
+                cfg.ref_num_start, cfg.mol_id_stop = layout  # I don't think I need this here
+
+        return layout
 
     def combine_lines(self, seperator: str = ' @ ') -> None:
         """
@@ -162,6 +186,7 @@ class Peak:
         self.reference_nums.append(int(ref))
         self.cas_nums.append(int(cas.replace('-', '')))
         self.qualities.append(int(qual))
+        self.hit_replicates.append(1)
 
     def parse_lines(self, keyword: str = "(CAS)", delimiter: str = "$$", seperator: str = '@') -> None:
         """
@@ -176,6 +201,7 @@ class Peak:
         :param seperator: Charactor used to denote the end of all molecule IDs.
         """
         lines = self.peak_block
+        debug = self.logger.isEnabledFor(logging.DEBUG)
 
         for line in lines:
             if seperator in line:
@@ -183,23 +209,56 @@ class Peak:
 
                 if keyword in line:
                     candidate = line[:line.find(keyword)]
-                    self.logger.debug(f"{keyword} candidate: {candidate}")
+                    if debug:
+                        self.logger.debug("%s candidate: %s", keyword, candidate)
 
                     if delimiter in candidate:
                         candidate = candidate[candidate.index(delimiter) + len(delimiter):]
-                        self.logger.debug(f"{delimiter} candidate: {candidate}")
+                        if debug:
+                            self.logger.debug("%s candidate: %s", delimiter, candidate)
 
                 else:
                     candidate = candidate[:candidate.find(delimiter)]
-                    self.logger.debug(f"Behind {delimiter} candidate: {candidate}")
+                    if debug:
+                        self.logger.debug("Behind %s candidate: %s", delimiter, candidate)
 
                 candidate = candidate.lower().strip()
                 if candidate not in self.ID:
-                    self.logger.info(f'Found molecule: {candidate}')
+                    self.logger.info('Found molecule: %s', candidate)
                     self.ID.append(candidate)
+                    self.synonyms.append(self.find_synonyms(line, candidate, keyword, delimiter, seperator))
                     self.trailing_values(line)
         # del self.peak_block
 
+    @staticmethod
+    def find_synonyms(line: str, candidate: str, keyword: str = "(CAS)", delimiter: str = "$$",
+                      seperator: str = '@') -> list[str]:
+        """
+        Collects every other molecule ID listed on a guess line, in the order they appear, so they can be tried
+        when the chosen ID fails to form a structure.
+
+        The export cuts the list at a fixed width, so a last molecule ID not closed by a delimiter is usually a
+        fragment, e.g. 'Acrylaldehy', and is left out rather than risk OPSIN reading it as another molecule.
+
+        :param line: Combined guess line.
+        :param candidate: Molecule ID already chosen for the guess.
+        :param keyword: String used to denote the best potential molecule ID.
+        :param delimiter: String used to denote different molecule IDs.
+        :param seperator: Charactor used to denote the end of all molecule IDs.
+        :return: List of unique alternative molecule IDs.
+        """
+        names = line.split(seperator)[0].rstrip()
+        fields = names.split(delimiter)
+        if len(fields) > 1 and not names.endswith(delimiter):
+            fields.pop()
+
+        synonyms: list[str] = []
+        for synonym in fields:
+            synonym = synonym.replace(keyword, '').strip()
+            if synonym and synonym.lower() != candidate and synonym not in synonyms:
+                synonyms.append(synonym)
+        return synonyms
+
     def find_molecule(self):
         pass
 
@@ -0,0 +1,117 @@
+import logging
+from bisect import bisect_right
+from statistics import fmean
+
+from peaks import Peak
+
+replicate_logger = logging.getLogger('GCMSpyDFT.replicates')
+
+TIME_EPSILON = 1e-9  # far below the 0.001 minute resolution of the reports
+
+
+def hit_key(cas_num: int, reference_num: int) -> tuple[str, int]:
+    """  Returns the key used to merge hits, the CAS number when present else the library reference number.  """
+    if cas_num:
+        return 'cas', cas_num
+    return 'ref', reference_num
+
+
+def align_peaks(replicates: list[list[Peak]], tolerance: float = 0.05) -> list[list[Peak]]:
+    """
+    Groups peaks from several replicate runs whose retention times agree within tolerance.
+
+    All peaks are sorted once by retention time and swept in order. A group is anchored at its earliest peak and
+    takes every following peak within tolerance of that anchor, unless the group already holds a peak from the
+    same replicate. Peaks that can not join the group start the next one.
+
+    :param replicates: One list of parsed peaks per replicate report.
+    :param tolerance: Largest retention time difference, in minutes, between peaks of the same group.
+    :return: List of peak groups ordered by retention time.
+    """
+    tagged = sorted(((peak.retention_time, run, peak)
+                     for run, peaks in enumerate(replicates)
+                     for peak in peaks),
+                    key=lambda item: (item[0], item[1]))
+    times = [item[0] for item in tagged]
+
+    groups: list[list[Peak]] = []
+    used = [False] * len(tagged)
+    for start, (anchor_time, _run, _peak) in enumerate(tagged):
+        if used[start]:
+            continue
+        # everything in tagged[start:stop] is within tolerance of the anchor, allowing for float rounding of the sum
+        stop = bisect_right(times, anchor_time + tolerance + TIME_EPSILON, lo=start)
+        group: list[Peak] = []
+        runs: set[int] = set()
+        for i in range(start, stop):
+            _time, run, peak = tagged[i]
+            if used[i] or run in runs:
+                continue
+            used[i] = True
+            runs.add(run)
+            group.append(peak)
+        groups.append(group)
+
+    replicate_logger.debug('Aligned %d peaks from %d replicates into %d groups.',
+                           len(tagged), len(replicates), len(groups))
+    return groups
+
+
+def merge_group(group: list[Peak], peak_num: int) -> Peak:
+    """
+    Combines a group of aligned peaks into a single consolidated peak.
+
+    Hits are merged by CAS number, or reference number when the CAS number is missing. The first name seen for a hit
+    is kept along with its best quality, and the number of replicates the hit appeared in is recorded.
+
+    :param group: Aligned peaks, at most one from each replicate.
+    :param peak_num: Number to give the consolidated peak.
+    :return: Consolidated peak.
+    """
+    merged = Peak([])
+    merged.peak_num = peak_num
+    merged.retention_time = round(fmean(peak.retention_time for peak in group), 3)
+    merged.percent_area = round(fmean(peak.percent_area for peak in group), 2)
+    merged.library = group[0].library
+    merged.replicate_count = len(group)
+
+    positions: dict[tuple[str, int], int] = {}
+    for peak in group:
+        seen: set[tuple[str, int]] = set()
+        for name, ref, cas, qual, synonyms in zip(peak.ID, peak.reference_nums, peak.cas_nums, peak.qualities,
+                                                  peak.synonyms):
+            key = hit_key(cas, ref)
+            if key in positions:
+                i = positions[key]
+                merged.qualities[i] = max(merged.qualities[i], qual)
+                for synonym in [name, *synonyms]:
+                    if synonym != merged.ID[i] and synonym not in merged.synonyms[i]:
+                        merged.synonyms[i].append(synonym)
+                if key not in seen:
+                    merged.hit_replicates[i] += 1
+            else:
+                positions[key] = len(merged.ID)
+                merged.ID.append(name)
+                merged.reference_nums.append(ref)
+                merged.cas_nums.append(cas)
+                merged.qualities.append(qual)
+                merged.synonyms.append(list(synonyms))
+                merged.hit_replicates.append(1)
+            seen.add(key)
+        merged.possible_IDs = max(merged.possible_IDs, peak.possible_IDs)
+
+    return merged
+
+
+def merge_replicates(replicates: list[list[Peak]], tolerance: float = 0.05) -> list[Peak]:
+    """
+    Aligns peaks across replicate reports and returns one consolidated peak per retention time.
+
+    :param replicates: One list of parsed peaks per replicate report.
+    :param tolerance: Largest retention time difference, in minutes, between peaks of the same group.
+    :return: Consolidated peaks ordered by retention time.
+    """
+    groups = align_peaks(replicates, tolerance)
+    merged = [merge_group(group, n) for n, group in enumerate(groups, start=1)]
+    replicate_logger.info('Merged %d replicates into %d peaks.', len(replicates), len(merged))
+    return merged
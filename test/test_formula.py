@@ -0,0 +1,22 @@
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from formula import condensed_to_smiles
+
+
+class CondensedToSmilesTest(unittest.TestCase):
+    def test_condensed_formulas_are_converted(self):
+        self.assertEqual(condensed_to_smiles('CH2=CHCHO'), 'C=CC=O')
+        self.assertEqual(condensed_to_smiles('CH3COOCH3'), 'CC(=O)OC')
+
+    def test_ambiguous_or_non_formula_names_are_left_for_opsin(self):
+        for name in ('CH3CHOHCH3', 'C2H5OH', 'NSC 8819'):
+            with self.subTest(name=name):
+                self.assertIsNone(condensed_to_smiles(name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import pathlib
+import sys
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from geometry import Geometry
+
+
+class GeometryTest(unittest.TestCase):
+    def setUp(self):
+        self.geometry = Geometry([6, 8], [(0.0, 0.0, 0.0), (1.2, 0.0, 0.0)], name='carbon monoxide')
+
+    def test_renamed_copy_does_not_share_coordinates(self):
+        copy = self.geometry.renamed('CO')
+        copy.coords[3] = 1.1
+        copy.numbers[1] = 7
+        self.assertEqual(copy.name, 'CO')
+        self.assertEqual(self.geometry.position(1), (1.2, 0.0, 0.0))
+        self.assertEqual(self.geometry.symbols(), ['C', 'O'])
+
+    def test_bytes_round_trip(self):
+        self.assertEqual(Geometry.from_bytes(self.geometry.to_bytes()), self.geometry)
+
+    def test_xyz_round_trip(self):
+        self.assertEqual(Geometry.from_xyz(self.geometry.to_xyz()), self.geometry)
+
+
+if __name__ == '__main__':
+    unittest.main()
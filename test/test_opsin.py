@@ -0,0 +1,65 @@
+"""
+OPSIN error handling, with openbabel and py2opsin replaced by empty modules so only the standard library is needed.
+"""
+import os
+import pathlib
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+
+class OpsinTest(unittest.TestCase):
+    def setUp(self):
+        openbabel = types.ModuleType('openbabel')
+        openbabel.openbabel = types.ModuleType('openbabel.openbabel')
+        openbabel.pybel = types.ModuleType('openbabel.pybel')
+        openbabel.openbabel.OBMol = openbabel.pybel.Molecule = object
+        py2opsin = types.ModuleType('py2opsin')
+        py2opsin.py2opsin = None
+        # dropped again on cleanup, together with the modules imported below
+        patcher = mock.patch.dict(sys.modules, {'openbabel': openbabel, 'openbabel.openbabel': openbabel.openbabel,
+                                                'openbabel.pybel': openbabel.pybel, 'py2opsin': py2opsin})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # importing config writes config.ini to the working directory
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp.name)
+        import api
+        import datamolecule
+        self.api, self.datamolecule = api, datamolecule
+
+    def test_reasons_are_paired_with_failed_names(self):
+        stderr = ('Picked up JAVA_TOOL_OPTIONS: -Xmx1g\n'
+                  'bad name is unparsable due to the following being uninterpretable: bad name\n'
+                  'Atom is in an unphysical valency state! Element: C valency: 5\n')
+        errors = self.datamolecule.opsin_errors(['bad name', 'ethanol', 'pentamethylmethane'], ['', 'CCO', ''],
+                                                stderr)
+        self.assertEqual(errors, {
+            'bad name': 'bad name is unparsable due to the following being uninterpretable: bad name',
+            'pentamethylmethane': 'Atom is in an unphysical valency state! Element: C valency: 5'})
+
+    def test_missing_reasons_are_not_guessed(self):
+        self.assertEqual(self.datamolecule.opsin_errors(['bad name', 'worse name'], ['', ''], 'one line\n'), {})
+
+    def test_reason_is_recorded_on_the_result(self):
+        def run_opsin(names, *_flags, errors=None):
+            errors.update((name, f'{name} is unparsable') for name in names)
+            return [''] * len(names)
+
+        result = self.api.HitResult(peak_num=1, retention_time=1.0, percent_area=1.0, index=0, name='bad name',
+                                    reference_num=1, cas_num=1, quality=90)
+        with mock.patch.object(self.datamolecule, 'run_opsin', run_opsin):
+            results = list(self.api.resolve_hits([(result, ['worse name'])], self.api.Settings()))
+        self.assertEqual(results, [result])
+        self.assertEqual(result.error, 'OPSIN could not convert the name or any synonym: bad name is unparsable')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import pathlib
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+
+def setUpModule():
+    # importing peaks loads the global config, which writes config.ini to the working directory
+    global Peak
+    tmp = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(tmp.name)
+    try:
+        from peaks import Peak
+    finally:
+        os.chdir(cwd)
+        tmp.cleanup()
+
+
+class FindSynonymsTest(unittest.TestCase):
+    def test_truncated_last_name_is_dropped(self):
+        line = '2-Propenal (CAS) $$ Acrolein $$ NSC 8819 $$ Acrylaldehy @ 401 000107-02-8  4'
+        self.assertEqual(Peak.find_synonyms(line, '2-propenal'), ['Acrolein', 'NSC 8819'])
+
+    def test_name_closed_by_delimiter_is_kept(self):
+        line = 'Acrolein $$ CH2=CHCHO $$ @ 401 000107-02-8  4'
+        self.assertEqual(Peak.find_synonyms(line, 'acrolein'), ['CH2=CHCHO'])
+
+    def test_keyword_removed_and_duplicates_skipped(self):
+        line = '2-Propenal $$ Acrolein (CAS) $$ Propenal $$ Propenal $$ Acrolein $$ @ 400 000107-02-8  4'
+        self.assertEqual(Peak.find_synonyms(line, 'acrolein'), ['2-Propenal', 'Propenal'])
+
+    def test_single_name_has_no_synonyms(self):
+        self.assertEqual(Peak.find_synonyms('ISO BUTYRALDEHYDE @ 1475 000078-84-2 72', 'iso butyraldehyde'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
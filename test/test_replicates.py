@@ -0,0 +1,87 @@
+import os
+import pathlib
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+
+def setUpModule():
+    # importing peaks loads the global config, which writes config.ini to the working directory
+    global replicates, Peak
+    tmp = tempfile.TemporaryDirectory()
+    cwd = os.getcwd()
+    os.chdir(tmp.name)
+    try:
+        import replicates
+        from peaks import Peak
+    finally:
+        os.chdir(cwd)
+        tmp.cleanup()
+
+
+def make_peak(retention_time: float, hits: list[tuple[str, int, int, int]] = (), peak_num: int = 1):
+    """  Peak with hits given as (name, reference number, CAS number, quality).  """
+    peak = Peak([])
+    peak.peak_num = peak_num
+    peak.retention_time = retention_time
+    peak.percent_area = 1.0
+    peak.library = 'WILEY275.L'
+    peak.possible_IDs = len(hits)
+    for name, ref, cas, qual in hits:
+        peak.ID.append(name)
+        peak.reference_nums.append(ref)
+        peak.cas_nums.append(cas)
+        peak.qualities.append(qual)
+        peak.hit_replicates.append(1)
+        peak.synonyms.append([])
+    return peak
+
+
+class AlignPeaksTest(unittest.TestCase):
+    def test_peaks_exactly_tolerance_apart_are_grouped(self):
+        first, second = make_peak(3.40), make_peak(3.45)
+        groups = replicates.align_peaks([[first], [second]], tolerance=0.05)
+        self.assertEqual(groups, [[first, second]])
+
+    def test_peaks_past_tolerance_are_separate(self):
+        first, second = make_peak(3.40), make_peak(3.451)
+        groups = replicates.align_peaks([[first], [second]], tolerance=0.05)
+        self.assertEqual(groups, [[first], [second]])
+
+    def test_one_peak_per_replicate_in_a_group(self):
+        early, late = make_peak(1.00), make_peak(1.02)
+        other = make_peak(1.01)
+        groups = replicates.align_peaks([[early, late], [other]], tolerance=0.05)
+        self.assertEqual(groups, [[early, other], [late]])
+
+
+class MergeGroupTest(unittest.TestCase):
+    def test_hits_merge_by_cas(self):
+        group = [make_peak(1.00, [('2-propenal', 401, 107028, 4)]),
+                 make_peak(1.01, [('acrolein', 400, 107028, 9)])]
+        merged = replicates.merge_group(group, 1)
+        self.assertEqual(merged.ID, ['2-propenal'])
+        self.assertEqual(merged.qualities, [9])
+        self.assertEqual(merged.synonyms, [['acrolein']])
+        self.assertEqual(merged.hit_replicates, [2])
+        self.assertEqual(merged.replicate_count, 2)
+
+    def test_hits_without_cas_merge_by_reference_number(self):
+        group = [make_peak(1.00, [('iso butyraldehyde', 1475, 0, 72), ('unknown a', 10, 0, 5)]),
+                 make_peak(1.01, [('isobutyraldehyde', 1475, 0, 70), ('unknown b', 11, 0, 5)])]
+        merged = replicates.merge_group(group, 1)
+        self.assertEqual(merged.ID, ['iso butyraldehyde', 'unknown a', 'unknown b'])
+        self.assertEqual(merged.hit_replicates, [2, 1, 1])
+
+    def test_hit_counted_once_per_replicate(self):
+        group = [make_peak(1.00, [('2-propenal', 401, 107028, 4), ('acrolein', 400, 107028, 4)]),
+                 make_peak(1.01, [('2-propenal', 401, 107028, 4)])]
+        merged = replicates.merge_group(group, 1)
+        self.assertEqual(merged.ID, ['2-propenal'])
+        self.assertEqual(merged.hit_replicates, [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
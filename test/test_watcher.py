@@ -0,0 +1,51 @@
+import os
+import pathlib
+import signal
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from watcher import Watcher
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = self.tmp.name
+        # run installs its own handlers
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+
+    def run_once(self, handled: list[str]) -> Watcher:
+        """  Runs a watcher that stops after handling its first report.  """
+        def handler(path: str) -> None:
+            handled.append(os.path.basename(path))
+            watcher.stop()
+
+        watcher = Watcher(self.directory, handler, interval=0.01, debounce=0)
+        watcher.run()
+        return watcher
+
+    def test_restart_skips_processed_reports(self):
+        report = pathlib.Path(self.directory, 'report.txt')
+        report.write_text('first')
+        handled = []
+        self.run_once(handled)
+        self.assertEqual(handled, ['report.txt'])
+
+        restarted = Watcher(self.directory, handled.append, debounce=0)
+        restarted.scan()
+        restarted.scan()
+        self.assertEqual(list(restarted.queue), [])
+
+        report.write_text('changed')
+        restarted.scan()
+        restarted.scan()
+        self.assertEqual(list(restarted.queue), [str(report)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""
+Runs several local workers against one queue database, with OPSIN and openbabel replaced by small stubs so the test
+only needs the standard library.
+"""
+import contextlib
+import multiprocessing
+import os
+import pathlib
+import sqlite3
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+
+def stub_modules() -> dict[str, types.ModuleType]:
+    """
+    Stand-ins for openbabel and py2opsin, to patch into sys.modules. datamolecule is left out of the patched modules
+    so it is imported again against the stubs, even if it was already imported with the real packages.
+    """
+    class Atom:
+        def __init__(self, number, position):
+            self.number, self.position = number, position
+
+        def GetAtomicNum(self):
+            return self.number
+
+        def GetX(self):
+            return self.position[0]
+
+        def GetY(self):
+            return self.position[1]
+
+        def GetZ(self):
+            return self.position[2]
+
+    class OBMol:
+        def __init__(self):
+            self.atoms = []
+
+        def GetTotalCharge(self):
+            return 0
+
+        def GetTotalSpinMultiplicity(self):
+            return 1
+
+        def GetTitle(self):
+            return ''
+
+        def Center(self):
+            pass
+
+    class Molecule:
+        charge, spin = 0, 1
+
+        def __init__(self, OBMol=None):
+            self.OBMol = OBMol if isinstance(OBMol, OBMol_type) else OBMol_type()
+            self.structure = ''
+
+        def addh(self):
+            pass
+
+        def make2D(self):
+            pass
+
+        def make3D(self):
+            self.OBMol.atoms = [Atom(6, (0.0, 0.0, 0.0)), Atom(8, (1.2, 0.0, 0.0))]
+
+        def write(self, out_format='smi', **_kwargs):
+            return f'KEY-{len(self.structure)}\n' if out_format == 'inchikey' else self.structure
+
+    def readstring(_in_format, structure):
+        molecule = Molecule()
+        molecule.structure = structure
+        return molecule
+
+    def py2opsin(chemical_name, **_kwargs):
+        # names starting with 'bad' fail, the rest become a chain as long as the name
+        return ['' if name.startswith('bad') else 'C' * len(name) for name in chemical_name]
+
+    OBMol_type = OBMol
+    openbabel = types.ModuleType('openbabel.openbabel')
+    openbabel.OBMol = OBMol
+    openbabel.OBMolAtomIter = lambda obmol: iter(obmol.atoms)
+    pybel = types.ModuleType('openbabel.pybel')
+    pybel.Molecule = Molecule
+    pybel.readstring = readstring
+    package = types.ModuleType('openbabel')
+    package.openbabel, package.pybel = openbabel, pybel
+    opsin = types.ModuleType('py2opsin')
+    opsin.__file__ = os.path.join(tempfile.gettempdir(), 'py2opsin-stub', '__init__.py')  # no jar next to it
+    opsin.py2opsin = py2opsin
+    return {'openbabel': package, 'openbabel.openbabel': openbabel, 'openbabel.pybel': pybel, 'py2opsin': opsin}
+
+
+@contextlib.contextmanager
+def stubbed_modules():
+    """  Patches the stubs into sys.modules, which is put back as it was on exit.  """
+    with mock.patch.dict(sys.modules, stub_modules()):
+        sys.modules.pop('datamolecule', None)
+        yield
+
+
+def run_worker(path: str, owner: str) -> int:
+    """  Worker process, runs from the queue directory so config.ini is made there.  """
+    with stubbed_modules():
+        os.chdir(os.path.dirname(path))
+        from workqueue import work
+        return work(path, lease=60, batch=3, poll=0.05, owner=owner)
+
+
+class WorkQueueTest(unittest.TestCase):
+    workers = 4
+    task_count = 40
+
+    def setUp(self):
+        self.enterContext(stubbed_modules())
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, self.cwd)
+        self.path = os.path.join(self.tmp.name, 'queue.sqlite')
+
+    def enqueue(self):
+        from api import HitResult, Settings
+        from workqueue import WorkQueue
+
+        hits = [(HitResult(peak_num=1, retention_time=1.0, percent_area=1.0, index=i,
+                           name='bad name' if i == 10 else f'molecule {i}',
+                           reference_num=i, cas_num=i, quality=90), [])
+                for i in range(self.task_count)]
+        with WorkQueue(self.path) as work_queue:
+            work_queue.enqueue('report.txt', hits, Settings(output=pathlib.Path(self.tmp.name, 'out')))
+
+    def test_every_task_finishes_once_after_expired_leases(self):
+        from workqueue import WorkQueue
+
+        self.enqueue()
+        with WorkQueue(self.path) as work_queue:
+            # a worker that crashed on the first task on every attempt
+            for _ in range(work_queue.max_attempts):
+                self.assertEqual([task_id for task_id, _, _ in work_queue.claim('crashed', lease=-1)], [1])
+            # and one that crashed holding five tasks, which start the next claim with their lease expired
+            crashed = [task_id for task_id, _, _ in work_queue.claim('crashed', lease=-1, limit=5)]
+            self.assertEqual(crashed, [2, 3, 4, 5, 6])
+
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(self.workers) as pool:
+            finished = pool.starmap(run_worker, [(self.path, f'worker-{n}') for n in range(self.workers)])
+
+        # task 1 ran out of attempts, every other task was finished by exactly one worker
+        self.assertEqual(sum(finished), self.task_count - 1)
+        with sqlite3.connect(self.path) as connection:
+            rows = dict(((task_id, (state, owner, attempts)) for task_id, state, owner, attempts
+                         in connection.execute('SELECT id, state, owner, attempts FROM tasks')))
+        self.assertEqual(len(rows), self.task_count)
+        self.assertEqual(rows[1][0], 'failed')
+        self.assertEqual(rows[11][0], 'failed')  # 'bad name', which OPSIN could not convert
+        for task_id, (state, owner, attempts) in rows.items():
+            self.assertIn(state, ('done', 'failed'))
+            if task_id != 1:
+                self.assertTrue(owner.startswith('worker-'))
+                self.assertEqual(attempts, 2 if task_id in crashed else 1)
+
+        written = list(pathlib.Path(self.tmp.name, 'out', 'report').rglob('*.inp'))
+        self.assertEqual(len(written), self.task_count - 2)
+
+    def test_opsin_failure_releases_tasks(self):
+        import datamolecule
+        from workqueue import WorkQueue, work
+
+        self.enqueue()
+        # py2opsin answering for no name is a failed run, not forty rejected names
+        with mock.patch.object(datamolecule, 'opsin', lambda **_kwargs: None):
+            with self.assertRaises(datamolecule.OpsinError):
+                work(self.path, batch=self.task_count, poll=0.05, owner='broken')
+
+        with sqlite3.connect(self.path) as connection:
+            rows = connection.execute('SELECT state, owner, attempts, result FROM tasks').fetchall()
+        self.assertEqual(set(rows), {('pending', None, 1, None)})
+
+        # a worker that can run OPSIN picks them all up
+        self.assertEqual(work(self.path, batch=self.task_count, poll=0.05, owner='working'), self.task_count)
+        with WorkQueue(self.path) as work_queue:
+            self.assertEqual(work_queue.counts(), {'pending': 0, 'leased': 0, 'done': self.task_count - 1,
+                                                   'failed': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
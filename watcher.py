@@ -0,0 +1,146 @@
+import fnmatch
+import json
+import logging
+import os
+import signal
+import time
+from collections import deque
+from typing import Callable
+
+watch_logger = logging.getLogger('GCMSpyDFT.watcher')
+
+
+class Watcher:
+    def __init__(self, directory: str, handler: Callable[[str], object], interval: float = 5.0,
+                 debounce: float = 30.0, pattern: str = '*.txt', status_path: str = None,
+                 processed_path: str = None):
+        """
+        Polls a directory for new or changed reports and passes each one to handler once it stops changing.
+
+        :param directory: Directory to watch.
+        :param handler: Called with the path of every report that is ready.
+        :param interval: Seconds between directory scans.
+        :param debounce: Seconds a file must keep the same size and modification time before it is processed.
+        :param pattern: Shell style pattern of file names to pick up.
+        :param status_path: JSON file the queue depth and progress are written to.
+        :param processed_path: JSON file the signatures of processed reports are kept in, so a restarted watcher only
+            picks up reports that are new or changed since. Defaults to a file next to the status file.
+        """
+        self.directory = directory
+        self.handler = handler
+        self.interval = interval
+        self.debounce = debounce
+        self.pattern = pattern
+        self.status_path = status_path or os.path.join(directory, '.gcmspydft-status.json')
+        self.processed_path = processed_path or os.path.join(os.path.dirname(os.path.abspath(self.status_path)),
+                                                             '.gcmspydft-processed.json')
+
+        self.queue: deque[str] = deque()                            # reports ready to process
+        self.signatures: dict[str, tuple] = {}                      # path: signature of a queued report
+        self.pending: dict[str, tuple[tuple, float]] = {}           # path: (signature, time first seen unchanged)
+        self.processed: dict[str, tuple] = self.load_processed()    # path: signature when last processed
+        self.running = False
+        self.current: str | None = None
+        self.done = 0
+        self.failed = 0
+        self.last_error: str | None = None
+
+    def load_processed(self) -> dict[str, tuple]:
+        """  Reads the signatures saved by an earlier run, keyed by path in the watched directory.  """
+        try:
+            with open(self.processed_path) as processed_file:
+                saved = json.load(processed_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            watch_logger.warning('Could not read processed reports from %s, starting fresh. %r', self.processed_path, e)
+            return {}
+        return {os.path.join(self.directory, name): tuple(signature) for name, signature in saved.items()}
+
+    def save_processed(self) -> None:
+        """  Atomically replaces the file of processed report signatures, keyed by file name.  """
+        saved = {os.path.basename(path): signature for path, signature in self.processed.items()}
+        temp_path = self.processed_path + '.tmp'
+        with open(temp_path, 'w') as processed_file:
+            json.dump(saved, processed_file)
+        os.replace(temp_path, self.processed_path)
+
+    def scan(self) -> None:
+        """  Looks for new or changed files and queues the ones that have settled.  """
+        now = time.monotonic()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if (not entry.is_file() or entry.name.startswith('.')
+                        or not fnmatch.fnmatch(entry.name, self.pattern)):
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+                path = entry.path
+
+                if self.processed.get(path) == signature or path in self.signatures:
+                    continue
+                previous = self.pending.get(path)
+                if previous is None or previous[0] != signature:
+                    # new or still being written, restart the debounce clock
+                    self.pending[path] = (signature, now)
+                elif now - previous[1] >= self.debounce:
+                    del self.pending[path]
+                    self.signatures[path] = signature
+                    self.queue.append(path)
+                    watch_logger.info('Queued report %s', path)
+
+    def write_status(self, state: str) -> None:
+        """  Atomically replaces the status file with the current state of the watcher.  """
+        status = {
+            'state': state,
+            'pid': os.getpid(),
+            'directory': os.path.abspath(self.directory),
+            'queue_depth': len(self.queue),
+            'waiting': len(self.pending),
+            'current': self.current,
+            'processed': self.done,
+            'failed': self.failed,
+            'last_error': self.last_error,
+            'updated': time.time(),
+        }
+        temp_path = self.status_path + '.tmp'
+        with open(temp_path, 'w') as status_file:
+            json.dump(status, status_file, indent=2)
+        os.replace(temp_path, self.status_path)
+
+    def stop(self, *_args) -> None:
+        """  Asks the watcher to stop once the current report is finished.  """
+        watch_logger.info('Shutting down watcher.')
+        self.running = False
+
+    def run(self) -> None:
+        """  Scans and processes reports until stopped by stop, SIGINT or SIGTERM.  """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        self.running = True
+        watch_logger.info('Watching %s every %s seconds.', self.directory, self.interval)
+
+        while self.running:
+            self.scan()
+            while self.queue and self.running:
+                self.current = self.queue.popleft()
+                self.write_status('processing')
+                try:
+                    self.handler(self.current)
+                    self.done += 1
+                except Exception as e:
+                    self.failed += 1
+                    self.last_error = f'{self.current}: {e!r}'
+                    watch_logger.exception('Failed to process %s', self.current)
+                # saved only once handled, so a report queued when the watcher stops is picked up again on restart
+                self.processed[self.current] = self.signatures.pop(self.current)
+                self.save_processed()
+                self.current = None
+            self.write_status('idle')
+
+            # sleep in short steps so a stop request is handled quickly
+            deadline = time.monotonic() + self.interval
+            while self.running and time.monotonic() < deadline:
+                time.sleep(min(0.5, self.interval))
+
+        self.write_status('stopped')
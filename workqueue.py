@@ -0,0 +1,233 @@
+import dataclasses
+import json
+import logging
+import os
+import pathlib
+import socket
+import sqlite3
+import time
+
+queue_logger = logging.getLogger('GCMSpyDFT.workqueue')
+
+
+class WorkQueue:
+    def __init__(self, path: str, max_attempts: int = 3):
+        """
+        SQLite backed queue of molecules to process, meant to live on storage shared by every worker.
+
+        Workers claim tasks with a lease. A task whose lease runs out, e.g. because its worker crashed, is handed to
+        the next worker that asks, until it has been tried max_attempts times.
+
+        :param path: Path of the queue database, created if missing.
+        :param max_attempts: Number of leases a task gets before it is marked as failed.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        # autocommit mode, every change below opens its own transaction
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS runs ('
+                                'id INTEGER PRIMARY KEY, '
+                                'report TEXT NOT NULL, '
+                                'settings TEXT NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tasks ('
+                                'id INTEGER PRIMARY KEY, '
+                                'run_id INTEGER NOT NULL REFERENCES runs (id), '
+                                'report TEXT NOT NULL, '
+                                'payload TEXT NOT NULL, '
+                                "state TEXT NOT NULL DEFAULT 'pending', "
+                                'owner TEXT, '
+                                'lease_expires REAL, '
+                                'attempts INTEGER NOT NULL DEFAULT 0, '
+                                'result TEXT)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def enqueue(self, report: str, hits: list, settings) -> int:
+        """
+        Adds one task per hit, together with the settings every task of this report is rendered with.
+
+        :param report: Name of the report the hits came from.
+        :param hits: HitResults paired with their synonyms, e.g. from api.peak_hits.
+        :param settings: api.Settings for the tasks of this report. The output directory is made absolute and gets a
+                         folder named after the report, so reports sharing the queue do not overwrite each other.
+        :return: Number of tasks added.
+        """
+        settings = settings.replace(output=settings.output.resolve() / pathlib.Path(report).stem)
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            run_id = self.connection.execute('INSERT INTO runs (report, settings) VALUES (?, ?)',
+                                             (report, json.dumps(settings.as_dict()))).lastrowid
+            rows = [(run_id, report, json.dumps({'hit': dataclasses.asdict(result), 'synonyms': synonyms}))
+                    for result, synonyms in hits]
+            self.connection.executemany('INSERT INTO tasks (run_id, report, payload) VALUES (?, ?, ?)', rows)
+        queue_logger.info('Queued %d tasks from %s into %s', len(rows), report, settings.output)
+        return len(rows)
+
+    def settings(self, run_id: int):
+        """  Returns the api.Settings stored by enqueue for a run.  """
+        from api import Settings
+        row = self.connection.execute('SELECT settings FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f'No run {run_id} in {self.path}')
+        return Settings.from_dict(json.loads(row[0]))
+
+    def claim(self, owner: str, lease: float = 600.0, limit: int = 1) -> list[tuple[int, int, dict]]:
+        """
+        Leases up to limit pending tasks, or tasks whose lease has expired, to owner.
+
+        :param owner: Name of the worker.
+        :param lease: Seconds until the tasks may be given to another worker.
+        :param limit: Largest number of tasks to claim.
+        :return: List of task ids, run ids and payloads.
+        """
+        now = time.time()
+        with self.connection:
+            # take the write lock up front so two workers can not claim the same rows
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute("UPDATE tasks SET state = 'failed', owner = NULL, "
+                                    "result = json_object('error', 'Ran out of attempts') "
+                                    "WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                                    "AND attempts >= ?",
+                                    (now, self.max_attempts))
+            rows = self.connection.execute("SELECT id, run_id, payload FROM tasks "
+                                           "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                                           "ORDER BY id LIMIT ?", (now, limit)).fetchall()
+            self.connection.executemany("UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, "
+                                        "attempts = attempts + 1 WHERE id = ?",
+                                        [(owner, now + lease, task_id) for task_id, _, _ in rows])
+        return [(task_id, run_id, json.loads(payload)) for task_id, run_id, payload in rows]
+
+    def renew(self, task_ids: list[int], owner: str, lease: float = 600.0) -> None:
+        """  Extends the lease of tasks still held by owner.  """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany("UPDATE tasks SET lease_expires = ? "
+                                        "WHERE id = ? AND owner = ? AND state = 'leased'",
+                                        [(time.time() + lease, task_id, owner) for task_id in task_ids])
+
+    def release(self, task_ids: list[int], owner: str) -> None:
+        """
+        Hands tasks held by owner back to the queue without a result, e.g. because OPSIN could not be run on this
+        worker. The attempt still counts, so tasks that no worker can process end up failed.
+        """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany("UPDATE tasks SET state = 'pending', owner = NULL, lease_expires = NULL "
+                                        "WHERE id = ? AND owner = ? AND state = 'leased'",
+                                        [(task_id, owner) for task_id in task_ids])
+
+    def finish(self, task_id: int, owner: str, result: dict, failed: bool = False) -> bool:
+        """
+        Records the result of a task held by owner.
+
+        :param task_id: Id of the task.
+        :param owner: Name of the worker.
+        :param result: JSON serializable result.
+        :param failed: Whether the task failed for good.
+        :return: False if the lease had already been taken over by another worker.
+        """
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            cursor = self.connection.execute("UPDATE tasks SET state = ?, result = ?, lease_expires = NULL "
+                                             "WHERE id = ? AND owner = ? AND state = 'leased'",
+                                             ('failed' if failed else 'done', json.dumps(result), task_id, owner))
+        return cursor.rowcount == 1
+
+    def counts(self) -> dict[str, int]:
+        """  Number of tasks in each state.  """
+        rows = self.connection.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall()
+        return {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0, **dict(rows)}
+
+
+def worker_name() -> str:
+    """  Name of this worker, unique across machines sharing the queue.  """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def work(path: str, lease: float = 600.0, batch: int = 10, poll: float = 5.0, owner: str = None) -> int:
+    """
+    Claims and processes tasks until the queue has no pending or leased tasks left.
+
+    The tasks of each report in a claimed batch are resolved with one OPSIN call and rendered with the settings
+    stored for that report, and the input files are written to its output directory. While other workers still hold
+    leases, this worker waits in case one of them crashes and its tasks need to be picked up.
+
+    If OPSIN itself fails, the unfinished tasks are released for other workers instead of being marked as failed,
+    and the error is raised.
+
+    :param path: Path of the queue database.
+    :param lease: Seconds a claimed batch is leased for, renewed after every finished task.
+    :param batch: Number of tasks claimed at once.
+    :param poll: Seconds to wait when other workers hold every remaining task.
+    :param owner: Name of this worker, defaults to host name and process id.
+    :return: Number of tasks this worker finished.
+    :raises datamolecule.OpsinError: If OPSIN could not be run.
+    """
+    from api import HitResult, open_library, resolve_hits
+    from datamolecule import OpsinError
+
+    owner = owner or worker_name()
+    finished = 0
+    run_settings = {}  # run id: settings
+    libraries = {}     # geometry library path: open library or None
+    with WorkQueue(path) as work_queue:
+        try:
+            while True:
+                tasks = work_queue.claim(owner, lease, batch)
+                if not tasks:
+                    counts = work_queue.counts()
+                    if not counts['pending'] and not counts['leased']:
+                        break
+                    time.sleep(poll)
+                    continue
+
+                queue_logger.info('%s claimed %d tasks', owner, len(tasks))
+                task_ids = {}
+                runs: dict[int, list] = {}
+                for task_id, run_id, payload in tasks:
+                    result = HitResult(**payload['hit'])
+                    task_ids[id(result)] = task_id
+                    runs.setdefault(run_id, []).append((result, payload['synonyms']))
+
+                remaining = [task_id for task_id, _, _ in tasks]
+                try:
+                    for run_id, hits in runs.items():
+                        if run_id not in run_settings:
+                            run_settings[run_id] = work_queue.settings(run_id)
+                        settings = run_settings[run_id]
+                        if settings.geometry_library not in libraries:
+                            libraries[settings.geometry_library] = open_library(settings)
+
+                        for result in resolve_hits(hits, settings, libraries[settings.geometry_library]):
+                            task_id = task_ids[id(result)]
+                            if result.error is None:
+                                file_path = settings.output / result.path
+                                file_path.parent.mkdir(parents=True, exist_ok=True)
+                                file_path.write_text(result.input_text)
+                            summary = {'path': str(result.path), 'synonym': result.synonym, 'error': result.error}
+                            if not work_queue.finish(task_id, owner, summary, failed=result.error is not None):
+                                queue_logger.warning('%s lost the lease on task %d', owner, task_id)
+                            finished += 1
+                            remaining.remove(task_id)
+                            if remaining:
+                                work_queue.renew(remaining, owner, lease)
+                except OpsinError:
+                    # says nothing about the names, so another worker gets them rather than failing them here
+                    queue_logger.exception('%s could not run OPSIN, releasing %d tasks', owner, len(remaining))
+                    work_queue.release(remaining, owner)
+                    raise
+        finally:
+            for library in libraries.values():
+                if library is not None:
+                    library.close()
+
+    queue_logger.info('%s finished %d tasks', owner, finished)
+    return finished